@@ -37,7 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework',
     'rest_framework.authtoken',
-    'core',
+    'core.apps.CoreConfig',
     'user',
     'recipe',
 
@@ -86,6 +86,22 @@ DATABASES = {
     }
 }
 
+# Cache
+# Os caches de listas e de versao dos dados precisam ser compartilhados
+# entre os processos. O LocMemCache padrao e de cada processo: com mais de
+# um worker a versao incrementada num worker nao chega aos outros, que
+# continuam servindo listas antigas; use memcached ou redis via env.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -126,4 +142,75 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
+# Entrega dos arquivos de MEDIA_ROOT (core.views.serve_media): vazio serve
+# pelo Django; 'x-accel-redirect' (nginx, com uma location internal em
+# MEDIA_ACCEL_REDIRECT_PREFIX apontando para MEDIA_ROOT) ou 'x-sendfile'
+# (Apache mod_xsendfile) deixam a copia dos bytes com o proxy
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE', '')
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get(
+    'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/'
+)
+# Cache-Control dos arquivos cujo nome nao vem do conteudo; os nomeados
+# pelo sha256 (core.storage) sao imutaveis
+MEDIA_CACHE_MAX_AGE = int(os.environ.get('MEDIA_CACHE_MAX_AGE', 24 * 60 * 60))
+
+# Os handlers padrao, calculando tambem o sha256 dos arquivos recebidos
+# (core.storage nomeia as imagens pelo conteudo)
+FILE_UPLOAD_HANDLERS = [
+    'core.uploads.HashingMemoryFileUploadHandler',
+    'core.uploads.HashingTemporaryFileUploadHandler',
+]
+
+# Variantes WebP geradas a partir da imagem da receita (core.images):
+# nome -> maior lado em pixels
+RECIPE_IMAGE_VARIANTS = {
+    'thumb': 200,
+    'medium': 800,
+}
+RECIPE_IMAGE_QUALITY = 80
+RECIPE_IMAGE_WORKERS = int(os.environ.get('RECIPE_IMAGE_WORKERS', 2))
+
+# Larguras aceitas no redimensionamento sob demanda e limite do cache em
+# disco dessas imagens (MEDIA_ROOT/cache/resized)
+RECIPE_IMAGE_WIDTHS = (160, 320, 480, 640, 960, 1280)
+RECIPE_IMAGE_CACHE_MAX_BYTES = int(
+    os.environ.get('RECIPE_IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+)
+
+# Maximo de receitas por requisicao na criacao em lote (POST de uma lista)
+RECIPE_BULK_MAX = int(os.environ.get('RECIPE_BULK_MAX', 500))
+
+# Limites do upload de imagem (core.uploads.ImageUploadHandler), checados
+# enquanto o corpo e recebido
+RECIPE_IMAGE_MAX_BYTES = int(
+    os.environ.get('RECIPE_IMAGE_MAX_BYTES', 10 * 1024 * 1024)
+)
+RECIPE_IMAGE_MAX_PIXELS = int(
+    os.environ.get('RECIPE_IMAGE_MAX_PIXELS', 40 * 1000 * 1000)
+)
+
+# Arquivos sem referencia mais novos que isso nao sao apagados pelo
+# collect_images (upload em andamento, ainda sem commit)
+RECIPE_IMAGE_GC_MIN_AGE = int(os.environ.get('RECIPE_IMAGE_GC_MIN_AGE', 3600))
+
 AUTH_USER_MODEL = 'core.User'
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+}
+
+# Cache da autenticacao por token (core.authentication). Com CACHE_ALIAS
+# definido usa o cache do Django em vez do LRU em memoria do processo.
+# A invalidacao (core.signals) so limpa o LRU do processo que fez a
+# alteracao: nos outros workers um token revogado ainda autentica por ate
+# LOCAL_TTL segundos, por isso ele e curto. Com o cache compartilhado a
+# invalidacao vale para todos e o TTL pode ser maior.
+TOKEN_AUTH_CACHE = {
+    'TTL': 60,
+    'LOCAL_TTL': 5,
+    'MAX_SIZE': 10000,
+    'CACHE_ALIAS': None,
+}
@@ -0,0 +1,102 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+
+
+class TokenCache:
+    """Cache de token -> (usuario, token)
+
+    Por padrao eh um LRU em memoria com TTL; se `cache_alias` for
+    informado usa o cache do Django, compartilhado entre processos.
+    O `delete` do LRU so vale no processo atual: nos demais a entrada
+    dura ate o TTL."""
+
+    def __init__(self, max_size=10000, ttl=60, cache_alias=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.cache_alias = cache_alias
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _cache_key(key):
+        """Nao usa o token puro como chave do cache"""
+        return 'auth-token:' + hashlib.sha256(key.encode()).hexdigest()
+
+    def get(self, key):
+        """Retorna (usuario, token) ou None se nao estiver no cache"""
+        if self.cache_alias:
+            return caches[self.cache_alias].get(self._cache_key(key))
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, (user, token) = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        # Cada request recebe sua propria copia do usuario
+        return copy.copy(user), token
+
+    def set(self, key, value):
+        """Guarda (usuario, token) no cache"""
+        if self.cache_alias:
+            caches[self.cache_alias].set(
+                self._cache_key(key), value, self.ttl
+            )
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """Remove o token do cache"""
+        if self.cache_alias:
+            caches[self.cache_alias].delete(self._cache_key(key))
+            return
+
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Esvazia o cache em memoria"""
+        with self._lock:
+            self._entries.clear()
+
+
+# O LRU em memoria nao e invalidado nos outros processos, entao usa o
+# LOCAL_TTL, curto, que limita por quanto tempo um token revogado ainda vale
+token_cache = TokenCache(
+    max_size=settings.TOKEN_AUTH_CACHE['MAX_SIZE'],
+    ttl=settings.TOKEN_AUTH_CACHE['TTL']
+    if settings.TOKEN_AUTH_CACHE['CACHE_ALIAS']
+    else settings.TOKEN_AUTH_CACHE['LOCAL_TTL'],
+    cache_alias=settings.TOKEN_AUTH_CACHE['CACHE_ALIAS'],
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Autenticacao por token que evita ir ao banco a cada request
+
+    O cache eh invalidado pelos signals em core.signals quando o token
+    eh apagado ou o usuario eh alterado."""
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, (user, token))
+        return user, token
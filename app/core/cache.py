@@ -0,0 +1,38 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _version_key(user_id):
+    return f'data-version:{user_id}'
+
+
+def data_version(user_id):
+    """Retorna a versao atual dos dados do usuario
+
+    A versao inicial vem do relogio para que, se a chave for descartada
+    pelo cache, a nova versao nunca repita uma versao ja usada."""
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_data_version(user_id):
+    """Invalida tudo o que foi guardado com a versao atual do usuario
+
+    So depois do commit: com a versao nova antes disso, uma listagem
+    concorrente ainda leria as linhas antigas e as guardaria na chave
+    nova. Fora de uma transacao roda na hora."""
+    transaction.on_commit(lambda: _bump(user_id))
+
+
+def _bump(user_id):
+    key = _version_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
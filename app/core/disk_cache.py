@@ -0,0 +1,94 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+
+class DiskLRUCache:
+    """Cache de arquivos em disco com limite de tamanho
+
+    A ordem de uso fica no mtime dos arquivos (um acerto faz utime), entao
+    e compartilhada entre processos. O tamanho total e estimado em
+    memoria e, ao passar de max_bytes, o diretorio e varrido e os
+    arquivos usados ha mais tempo sao apagados ate sobrar `low_water`
+    do limite."""
+    low_water = 0.9
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def open(self, key):
+        """Retorna o arquivo de `key` aberto para leitura, ou None"""
+        path = self.path(key)
+        try:
+            fp = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Apagado por outro processo depois do open; o fp continua valido
+            pass
+        return fp
+
+    def put(self, key, data):
+        """Grava `data` em `key` e apaga os arquivos mais antigos se o
+        cache passar do limite"""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Escreve num temporario e renomeia, para nunca servir um arquivo
+        # pela metade
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._size = self._evict()
+
+    def _entries(self):
+        """(mtime, tamanho, caminho) de todos os arquivos do cache"""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        """Apaga os arquivos menos usados e retorna o tamanho restante"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * self.low_water
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
@@ -0,0 +1,210 @@
+import io
+import logging
+import math
+import os
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.http import Http404
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from core.cache import bump_data_version
+from core.disk_cache import DiskLRUCache
+from core.models import Recipe
+from core.storage import image_storage
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Imagens redimensionadas sob demanda (RecipeViewSet.image)
+resized_cache = DiskLRUCache(
+    os.path.join(settings.MEDIA_ROOT, 'cache', 'resized'),
+    settings.RECIPE_IMAGE_CACHE_MAX_BYTES
+)
+
+
+def _get_executor():
+    """Pool de threads do processo; o Pillow libera o GIL ao
+    decodificar e redimensionar"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix='recipe-images'
+            )
+    return _executor
+
+
+class InvalidImage(ValueError):
+    """O arquivo nao e uma imagem que o Pillow reconhece"""
+
+
+class ImageTooLarge(ValueError):
+    """A imagem tem mais pixels que RECIPE_IMAGE_MAX_PIXELS"""
+
+
+def check_image(fp):
+    """Valida a imagem lendo so o cabecalho, sem decodificar os pixels,
+    e retorna (formato, largura, altura)
+
+    Levanta InvalidImage ou ImageTooLarge."""
+    max_pixels = settings.RECIPE_IMAGE_MAX_PIXELS
+    try:
+        with warnings.catch_warnings():
+            # O limite que vale e o nosso, checado abaixo
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            with Image.open(fp) as img:
+                fmt, (width, height) = img.format, img.size
+    except Image.DecompressionBombError:
+        raise ImageTooLarge(
+            f'Image has more than {max_pixels} pixels.'
+        )
+    except Exception:
+        raise InvalidImage(
+            'Upload a valid image. The file you uploaded was either not '
+            'an image or a corrupted image.'
+        )
+    if width * height > max_pixels:
+        raise ImageTooLarge(
+            f'Image has {width * height} pixels, the limit is {max_pixels}.'
+        )
+    return fmt, width, height
+
+
+def variant_name(name, variant):
+    """Caminho da variante `variant` da imagem `name`"""
+    return f'{os.path.splitext(name)[0]}_{variant}.webp'
+
+
+def _prepare(img, size):
+    """Prepara a imagem aberta para ser reduzida ate `size`
+
+    No JPEG decodifica direto numa escala menor, que ainda cobre `size`,
+    em vez da imagem inteira."""
+    img.draft('RGB', size)
+    img = ImageOps.exif_transpose(img)
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+    return img
+
+
+def render_variants(fp):
+    """Gera {variante: bytes WebP} de uma imagem aberta"""
+    sizes = settings.RECIPE_IMAGE_VARIANTS
+    with Image.open(fp) as img:
+        largest = max(sizes.values())
+        img = _prepare(img, (largest, largest))
+
+        rendered = {}
+        for variant, size in sorted(sizes.items(), key=lambda item: -item[1]):
+            # Cada variante parte da anterior, que ja e menor
+            img.thumbnail((size, size), Image.LANCZOS)
+            buf = io.BytesIO()
+            img.save(buf, 'WEBP', quality=settings.RECIPE_IMAGE_QUALITY)
+            rendered[variant] = buf.getvalue()
+    return rendered
+
+
+def _display_size(img):
+    """Tamanho da imagem depois de aplicada a orientacao do EXIF"""
+    # Orientacoes 5 a 8 giram 90 graus: largura e altura trocam
+    if img.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+        return img.height, img.width
+    return img.size
+
+
+def render_width(fp, width):
+    """WebP da imagem com no maximo `width` de largura, sem ampliar"""
+    with Image.open(fp) as img:
+        # O draft e pedido nos eixos gravados no arquivo, antes da rotacao
+        scale = width / _display_size(img)[0]
+        img = _prepare(img, (math.ceil(img.width * scale),
+                             math.ceil(img.height * scale)))
+        if img.width > width:
+            img = img.resize(
+                (width, max(1, round(img.height * width / img.width))),
+                Image.LANCZOS
+            )
+        buf = io.BytesIO()
+        img.save(buf, 'WEBP', quality=settings.RECIPE_IMAGE_QUALITY)
+    return buf.getvalue()
+
+
+def resized_key(name, width):
+    """Chave de cache (e ETag) da imagem `name` com largura `width`"""
+    return f'{name}:{width}'
+
+
+def open_resized(name, width):
+    """Retorna a imagem redimensionada, como arquivo aberto quando ja
+    esta no cache (sem decodificar nada) ou como bytes recem gerados"""
+    key = resized_key(name, width)
+    fp = resized_cache.open(key)
+    if fp is not None:
+        return fp
+    try:
+        original = image_storage.open(name)
+    except FileNotFoundError:
+        raise Http404('Image file not found.')
+    with original:
+        data = render_width(original, width)
+    resized_cache.put(key, data)
+    return data
+
+
+def generate_variants(recipe_id, user_id, name):
+    """Gera as variantes da imagem `name` e grava em image_variants,
+    se a receita ainda tiver a mesma imagem
+
+    O nome da imagem vem do conteudo (core.storage), entao variantes que
+    ja existem sao de uma imagem identica e sao reaproveitadas. Uma imagem
+    que nao abre e registrada no log e fica sem variantes."""
+    variants = {
+        variant: variant_name(name, variant)
+        for variant in settings.RECIPE_IMAGE_VARIANTS
+    }
+    if not all(map(image_storage.touch, variants.values())):
+        try:
+            with image_storage.open(name) as fp:
+                rendered = render_variants(fp)
+        except Exception:
+            # Roda no pool de threads: sem o log o erro ficaria so no
+            # future, que ninguem le
+            logger.exception('Failed to generate variants of %s', name)
+            return {}
+        for variant, data in rendered.items():
+            path = variants[variant]
+            if image_storage.exists(path):
+                image_storage.delete(path)
+            variants[variant] = image_storage.save_as(path, ContentFile(data))
+
+    updated = Recipe.objects.filter(pk=recipe_id, image=name) \
+        .update(image_variants=variants, updated_at=timezone.now())
+    if updated:
+        # update() nao dispara os signals de invalidacao
+        bump_data_version(user_id)
+    return variants
+
+
+def _run(recipe_id, user_id, name):
+    try:
+        generate_variants(recipe_id, user_id, name)
+    except Exception:
+        logger.exception('Failed to generate variants of %s', name)
+    finally:
+        close_old_connections()
+
+
+def enqueue_variants(recipe):
+    """Agenda a geracao das variantes da imagem da receita para depois
+    do commit, fora da requisicao"""
+    args = (recipe.pk, recipe.user_id, recipe.image.name)
+    transaction.on_commit(lambda: _get_executor().submit(_run, *args))
@@ -0,0 +1,82 @@
+import os
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.models import Recipe
+from core.storage import image_storage
+
+
+class Command(BaseCommand):
+    """Apaga as imagens de receita que nenhuma receita referencia
+
+    Conta as referencias de cada arquivo (imagem e variantes) em
+    uploads/recipe; os arquivos sem nenhuma, mais antigos que --min-age,
+    sao apagados. Com o storage por conteudo (core.storage) varias
+    receitas podem apontar para o mesmo arquivo."""
+    help = 'Apaga as imagens de receita sem referencia'
+
+    directory = 'uploads/recipe'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=settings.RECIPE_IMAGE_GC_MIN_AGE,
+            help='Idade minima, em segundos, dos arquivos apagados'
+        )
+        parser.add_argument('--dry-run', action='store_true',
+                            help='So lista os arquivos, sem apagar')
+
+    def handle(self, *args, **options):
+        # A data de corte vem antes da contagem: um arquivo mais antigo que
+        # ela e sem referencia nao e de um upload em andamento
+        cutoff = time.time() - options['min_age']
+        references = self._count_references()
+
+        removed = freed = 0
+        for name in self._walk(self.directory):
+            if references[name]:
+                continue
+            path = image_storage.path(name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime > cutoff:
+                continue
+            if options['dry_run']:
+                self.stdout.write(name)
+            else:
+                image_storage.delete(name)
+            removed += 1
+            freed += stat.st_size
+
+        shared = sum(1 for count in references.values() if count > 1)
+        verb = 'Would remove' if options['dry_run'] else 'Removed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {removed} files ({freed / 1024 / 1024:.1f} MB); '
+            f'{len(references)} referenced, {shared} shared'
+        ))
+
+    @staticmethod
+    def _count_references():
+        """Numero de receitas que usam cada arquivo"""
+        references = Counter()
+        rows = Recipe.objects.exclude(image='').exclude(image=None) \
+            .values_list('image', 'image_variants')
+        for image, variants in rows.iterator():
+            references[image] += 1
+            references.update(variants.values())
+        return references
+
+    def _walk(self, directory):
+        """Nomes de todos os arquivos abaixo de `directory` no storage"""
+        try:
+            dirs, files = image_storage.listdir(directory)
+        except FileNotFoundError:
+            return
+        for name in files:
+            yield os.path.join(directory, name)
+        for sub in dirs:
+            yield from self._walk(os.path.join(directory, sub))
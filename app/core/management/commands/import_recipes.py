@@ -0,0 +1,177 @@
+import csv
+import io
+import json
+import os
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.cache import bump_data_version
+from core.models import Tag, Ingredient, Recipe, UserNameManager
+
+
+class Command(BaseCommand):
+    """Importa receitas em massa de um arquivo CSV ou JSONL
+
+    Cada registro tem title, time_minutes, price e opcionalmente link,
+    tags e ingredients. No CSV as tags e ingredientes sao nomes separados
+    por '|', no JSONL sao listas de nomes."""
+    help = 'Importa receitas em massa de um arquivo CSV ou JSONL'
+
+    relations = (('tags', Tag), ('ingredients', Ingredient))
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--user', required=True,
+                            help='Email do dono das receitas')
+        parser.add_argument('--format', choices=('csv', 'jsonl'),
+                            help='Padrao: deduzido pela extensao')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'User {options["user"]} does not exist')
+
+        fmt = options['format'] or \
+            os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if fmt not in ('csv', 'jsonl'):
+            raise CommandError('Use --format csv or --format jsonl')
+
+        # Cache nome -> id das tags e ingredientes do usuario
+        self.name_ids = {relation: {} for relation, _ in self.relations}
+        total = 0
+        start = time.monotonic()
+        with open(options['path'], newline='', encoding='utf-8') as fp:
+            records = self._read_records(fp, fmt)
+            while True:
+                batch = list(islice(records, options['batch_size']))
+                if not batch:
+                    break
+                with transaction.atomic():
+                    self._import_batch(user, batch)
+                    # bulk_create e COPY nao disparam os signals de
+                    # invalidacao; a versao muda no commit de cada lote,
+                    # entao um erro num lote seguinte nao esconde os ja
+                    # gravados atras das listas em cache
+                    bump_data_version(user.id)
+                total += len(batch)
+                elapsed = time.monotonic() - start
+                self.stdout.write(
+                    f'{total} recipes ({total / elapsed:.0f} rows/s)'
+                )
+
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {total} recipes in {elapsed:.1f}s '
+            f'({total / elapsed if elapsed else 0:.0f} rows/s)'
+        ))
+
+    @staticmethod
+    def _split_names(value):
+        if isinstance(value, str):
+            value = value.split('|')
+        names = map(UserNameManager.normalize_name, value or [])
+        return [name for name in names if name]
+
+    def _read_records(self, fp, fmt):
+        """Gera os registros normalizados e validados do arquivo"""
+        if fmt == 'csv':
+            rows = enumerate(csv.DictReader(fp), start=2)
+        else:
+            rows = ((number, line) for number, line in enumerate(fp, start=1)
+                    if line.strip())
+        for number, row in rows:
+            try:
+                if fmt == 'jsonl':
+                    row = json.loads(row)
+                    if not isinstance(row, dict):
+                        raise ValueError('expected a JSON object')
+                yield self._clean_record(row)
+            except ValidationError as exc:
+                raise CommandError(
+                    f'Line {number}: invalid record ({" ".join(exc.messages)})'
+                )
+            except (KeyError, ValueError, TypeError, AttributeError,
+                    InvalidOperation) as exc:
+                # Colunas faltando no CSV viram None e o JSONL pode trazer
+                # null, numeros ou listas onde se esperava outro tipo
+                raise CommandError(f'Line {number}: invalid record ({exc})')
+
+    def _clean_record(self, row):
+        """Converte a linha e aplica as restricoes dos campos do modelo,
+        para que uma linha invalida nao derrube o lote inteiro no banco"""
+        record = {
+            'title': row['title'],
+            'time_minutes': int(row['time_minutes']),
+            'price': Decimal(str(row['price'])),
+            'link': row.get('link') or '',
+        }
+        for field, value in record.items():
+            record[field] = Recipe._meta.get_field(field).clean(value, None)
+        for relation, model in self.relations:
+            names = self._split_names(row.get(relation))
+            max_length = model._meta.get_field('name').max_length
+            if any(len(name) > max_length for name in names):
+                raise ValidationError(
+                    f'{relation}: names must have at most {max_length} '
+                    f'characters'
+                )
+            record[relation] = names
+        return record
+
+    def _resolve_names(self, user, relation, model, names):
+        """Retorna nome -> id, criando em lote os nomes que faltam"""
+        name_ids = self.name_ids[relation]
+        missing = set(names) - set(name_ids)
+        if missing:
+            name_ids.update(
+                (name, pk)
+                for pk, name, _ in model.objects.upsert_names(user, missing)
+            )
+        return name_ids
+
+    def _import_batch(self, user, batch):
+        recipes = Recipe.objects.bulk_create([
+            Recipe(user=user, title=record['title'],
+                   time_minutes=record['time_minutes'],
+                   price=record['price'], link=record['link'])
+            for record in batch
+        ])
+        for relation, model in self.relations:
+            names = {name for record in batch for name in record[relation]}
+            name_ids = self._resolve_names(user, relation, model, names)
+            links = [
+                (recipe.id, name_ids[name])
+                for recipe, record in zip(recipes, batch)
+                for name in dict.fromkeys(record[relation])
+            ]
+            self._insert_links(relation, links)
+        created = Recipe.objects.filter(
+            pk__in=[recipe.pk for recipe in recipes]
+        )
+        created.update_link_fields()
+
+    @staticmethod
+    def _insert_links(relation, links):
+        """Insere os vinculos m2m com COPY"""
+        if not links:
+            return
+        field = Recipe._meta.get_field(relation)
+        through = field.remote_field.through
+        recipe_column = f'{field.m2m_field_name()}_id'
+        target_column = f'{field.m2m_reverse_field_name()}_id'
+
+        data = io.StringIO(''.join(f'{r}\t{t}\n' for r, t in links))
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {through._meta.db_table} '
+                f'({recipe_column}, {target_column}) FROM STDIN',
+                data
+            )
@@ -0,0 +1,62 @@
+from django.db import migrations, models
+
+
+def create_index_concurrently(name, table, columns):
+    """Cria o indice sem bloquear escritas na tabela"""
+    return migrations.RunSQL(
+        f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" '
+        f'ON "{table}" ({", ".join(columns)});',
+        reverse_sql=f'DROP INDEX CONCURRENTLY IF EXISTS "{name}";',
+    )
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY nao pode rodar dentro de uma transacao
+    atomic = False
+
+    dependencies = [
+        ('core', '0005_recipe_image'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                create_index_concurrently(
+                    'core_tag_user_name_idx',
+                    'core_tag', ['user_id', 'name'],
+                ),
+                create_index_concurrently(
+                    'core_ingredient_user_name_idx',
+                    'core_ingredient', ['user_id', 'name'],
+                ),
+                create_index_concurrently(
+                    'core_recipe_user_id_idx',
+                    'core_recipe', ['user_id', 'id'],
+                ),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='tag',
+                    index=models.Index(fields=['user', 'name'], name='core_tag_user_name_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='ingredient',
+                    index=models.Index(fields=['user', 'name'], name='core_ingredient_user_name_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='recipe',
+                    index=models.Index(fields=['user', 'id'], name='core_recipe_user_id_idx'),
+                ),
+            ],
+        ),
+        # Tabelas m2m geradas automaticamente so tem o indice unico
+        # (recipe_id, x_id); estes cobrem a busca no sentido inverso
+        create_index_concurrently(
+            'core_recipe_tags_tag_id_recipe_id_idx',
+            'core_recipe_tags', ['tag_id', 'recipe_id'],
+        ),
+        create_index_concurrently(
+            'core_recipe_ingredients_ingredient_id_recipe_id_idx',
+            'core_recipe_ingredients', ['ingredient_id', 'recipe_id'],
+        ),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicates(apps, schema_editor):
+    """Junta tags e ingredientes com o mesmo (usuario, nome) no de menor
+    id, movendo os vinculos com receitas antes de apagar os repetidos"""
+    Recipe = apps.get_model('core', 'Recipe')
+    for model_name, relation in (('Tag', 'tags'), ('Ingredient', 'ingredients')):
+        model = apps.get_model('core', model_name)
+        through = Recipe._meta.get_field(relation).remote_field.through
+        target = f'{model_name.lower()}_id'
+
+        duplicates = model.objects.values('user_id', 'name') \
+            .annotate(keep=Min('id'), total=Count('id')) \
+            .filter(total__gt=1)
+        for duplicate in duplicates.iterator():
+            others = model.objects.filter(
+                user_id=duplicate['user_id'], name=duplicate['name']
+            ).exclude(id=duplicate['keep'])
+            linked = set(through.objects.filter(**{
+                target: duplicate['keep']
+            }).values_list('recipe_id', flat=True))
+            recipe_ids = set(through.objects.filter(**{
+                f'{target}__in': others
+            }).values_list('recipe_id', flat=True))
+            through.objects.bulk_create([
+                through(recipe_id=recipe_id, **{target: duplicate['keep']})
+                for recipe_id in recipe_ids - linked
+            ])
+            others.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+from django.db import migrations, models
+
+
+def unique_constraint_concurrently(name, table, old_index):
+    """Cria o indice unico sem bloquear escritas e o promove a
+    constraint, substituindo o indice (user_id, name) antigo"""
+    return migrations.RunSQL(
+        [
+            f'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS "{name}" '
+            f'ON "{table}" (user_id, name);',
+            f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" '
+            f'UNIQUE USING INDEX "{name}";',
+            f'DROP INDEX CONCURRENTLY IF EXISTS "{old_index}";',
+        ],
+        reverse_sql=[
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{old_index}" '
+            f'ON "{table}" (user_id, name);',
+            f'ALTER TABLE "{table}" DROP CONSTRAINT IF EXISTS "{name}";',
+        ],
+    )
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY nao pode rodar dentro de uma transacao
+    atomic = False
+
+    dependencies = [
+        ('core', '0008_dedupe_user_names'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                unique_constraint_concurrently(
+                    'core_tag_user_name_uniq',
+                    'core_tag', 'core_tag_user_name_idx',
+                ),
+                unique_constraint_concurrently(
+                    'core_ingredient_user_name_uniq',
+                    'core_ingredient', 'core_ingredient_user_name_idx',
+                ),
+            ],
+            state_operations=[
+                migrations.RemoveIndex(
+                    model_name='tag',
+                    name='core_tag_user_name_idx',
+                ),
+                migrations.RemoveIndex(
+                    model_name='ingredient',
+                    name='core_ingredient_user_name_idx',
+                ),
+                migrations.AddConstraint(
+                    model_name='tag',
+                    constraint=models.UniqueConstraint(fields=('user', 'name'), name='core_tag_user_name_uniq'),
+                ),
+                migrations.AddConstraint(
+                    model_name='ingredient',
+                    constraint=models.UniqueConstraint(fields=('user', 'name'), name='core_ingredient_user_name_uniq'),
+                ),
+            ],
+        ),
+    ]
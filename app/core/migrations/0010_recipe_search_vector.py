@@ -0,0 +1,57 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def relation_vector(through, target, column, weight):
+    return (
+        f"setweight(to_tsvector('english', coalesce(("
+        f"SELECT string_agg(t.name, ' ') FROM {target} t "
+        f"JOIN {through} l ON l.{column} = t.id "
+        f"WHERE l.recipe_id = core_recipe.id), '')), '{weight}')"
+    )
+
+
+# Mesmo calculo de RecipeQuerySet.update_search_vector
+BACKFILL_SQL = (
+    "UPDATE core_recipe SET search_vector = "
+    "setweight(to_tsvector('english', core_recipe.title), 'A') || "
+    + relation_vector('core_recipe_tags', 'core_tag', 'tag_id', 'B')
+    + " || " + relation_vector('core_recipe_ingredients', 'core_ingredient',
+                               'ingredient_id', 'C')
+)
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY nao pode rodar dentro de uma transacao
+    atomic = False
+
+    dependencies = [
+        ('core', '0009_unique_user_names'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, reverse_sql=migrations.RunSQL.noop),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    'CREATE INDEX CONCURRENTLY IF NOT EXISTS '
+                    '"core_recipe_search_idx" ON "core_recipe" '
+                    'USING gin ("search_vector");',
+                    reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS '
+                                '"core_recipe_search_idx";',
+                ),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='recipe',
+                    index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='core_recipe_search_idx'),
+                ),
+            ],
+        ),
+    ]
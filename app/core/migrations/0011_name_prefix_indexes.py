@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+def create_prefix_index(name, table):
+    """Indice para LIKE 'prefixo%' em lower(name), sem bloquear escritas"""
+    return migrations.RunSQL(
+        f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" '
+        f'ON "{table}" (user_id, lower(name) text_pattern_ops);',
+        reverse_sql=f'DROP INDEX CONCURRENTLY IF EXISTS "{name}";',
+    )
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY nao pode rodar dentro de uma transacao
+    atomic = False
+
+    dependencies = [
+        ('core', '0010_recipe_search_vector'),
+    ]
+
+    # Indices de expressao nao sao suportados no Meta.indexes do Django 2.2
+    operations = [
+        create_prefix_index('core_tag_user_lower_name_idx', 'core_tag'),
+        create_prefix_index('core_ingredient_user_lower_name_idx',
+                            'core_ingredient'),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_name_prefix_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredient_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(
+            'UPDATE core_recipe SET ingredient_count = l.count '
+            'FROM (SELECT recipe_id, count(*) AS count '
+            'FROM core_recipe_ingredients GROUP BY recipe_id) l '
+            'WHERE l.recipe_id = core_recipe.id',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
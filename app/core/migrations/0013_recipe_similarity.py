@@ -0,0 +1,67 @@
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+from core import similarity
+
+
+def backfill_signatures(apps, schema_editor):
+    """Calcula a assinatura das receitas existentes em lotes"""
+    Recipe = apps.get_model('core', 'Recipe')
+    relations = (
+        ('tags', Recipe.tags.through, 'tag_id'),
+        ('ingredients', Recipe.ingredients.through, 'ingredient_id'),
+    )
+    ids = list(Recipe.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(ids), 2000):
+        features = {pk: [] for pk in ids[start:start + 2000]}
+        for relation, through, target in relations:
+            links = through.objects.filter(recipe_id__in=list(features)) \
+                .values_list('recipe_id', target)
+            for recipe_id, target_id in links:
+                features[recipe_id].append(
+                    similarity.feature(relation, target_id)
+                )
+        similarity.save_signatures(
+            schema_editor.connection, Recipe._meta.db_table, features
+        )
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY nao pode rodar dentro de uma transacao
+    atomic = False
+
+    dependencies = [
+        ('core', '0012_recipe_ingredient_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='minhash',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), default=list, editable=False, size=None),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='lsh_bands',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), default=list, editable=False, size=None),
+        ),
+        migrations.RunPython(backfill_signatures, migrations.RunPython.noop),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    'CREATE INDEX CONCURRENTLY IF NOT EXISTS '
+                    '"core_recipe_lsh_bands_idx" ON "core_recipe" '
+                    'USING gin ("lsh_bands");',
+                    reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS '
+                                '"core_recipe_lsh_bands_idx";',
+                ),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='recipe',
+                    index=django.contrib.postgres.indexes.GinIndex(fields=['lsh_bands'], name='core_recipe_lsh_bands_idx'),
+                ),
+            ],
+        ),
+    ]
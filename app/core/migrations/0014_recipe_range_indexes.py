@@ -0,0 +1,44 @@
+from django.db import migrations, models
+
+
+def create_index_concurrently(name, table, columns):
+    """Cria o indice sem bloquear escritas na tabela"""
+    return migrations.RunSQL(
+        f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" '
+        f'ON "{table}" ({", ".join(columns)});',
+        reverse_sql=f'DROP INDEX CONCURRENTLY IF EXISTS "{name}";',
+    )
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY nao pode rodar dentro de uma transacao
+    atomic = False
+
+    dependencies = [
+        ('core', '0013_recipe_similarity'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                create_index_concurrently(
+                    'core_recipe_user_price_idx',
+                    'core_recipe', ['user_id', 'price', 'id'],
+                ),
+                create_index_concurrently(
+                    'core_recipe_user_time_idx',
+                    'core_recipe', ['user_id', 'time_minutes', 'id'],
+                ),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='recipe',
+                    index=models.Index(fields=['user', 'price', 'id'], name='core_recipe_user_price_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='recipe',
+                    index=models.Index(fields=['user', 'time_minutes', 'id'], name='core_recipe_user_time_idx'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,100 @@
+from django.db import migrations
+from django.db.models.functions import Now
+
+from core import similarity
+from core.cache import bump_data_version
+
+# Nomes com espacos nas pontas, repetidos ou que nao sejam ' '
+NOT_NORMALIZED = r'^\s|\s$|\s\s|[\t\n\r\f\v]'
+
+
+def normalize_name(name):
+    """O mesmo UserNameManager.normalize_name do modelo"""
+    return ' '.join(name.split())
+
+
+def normalize_names(apps, schema_editor):
+    """Normaliza os espacos dos nomes de tags e ingredientes como o
+    serializer faz, juntando no que ja existe os que passam a repetir um
+    nome do mesmo usuario
+
+    A 0008 so juntou nomes identicos; com a restricao unica da 0009 ja
+    criada, cada nome e renomeado ou, se o normalizado ja existe, tem os
+    vinculos movidos e e apagado."""
+    Recipe = apps.get_model('core', 'Recipe')
+    affected_recipes = set()
+    affected_users = set()
+    for model_name, relation in (('Tag', 'tags'), ('Ingredient', 'ingredients')):
+        model = apps.get_model('core', model_name)
+        through = Recipe._meta.get_field(relation).remote_field.through
+        target = f'{model_name.lower()}_id'
+
+        rows = list(
+            model.objects.filter(name__regex=NOT_NORMALIZED)
+            .order_by('id').values_list('id', 'user_id', 'name')
+        )
+        for pk, user_id, name in rows:
+            name = normalize_name(name)
+            if not name:
+                continue
+            affected_users.add(user_id)
+            recipe_ids = set(through.objects.filter(**{target: pk})
+                             .values_list('recipe_id', flat=True))
+            affected_recipes |= recipe_ids
+            keep = model.objects.filter(user_id=user_id, name=name) \
+                .exclude(id=pk).values_list('id', flat=True).first()
+            if keep is None:
+                model.objects.filter(id=pk).update(name=name)
+                continue
+
+            linked = set(through.objects.filter(**{target: keep})
+                         .values_list('recipe_id', flat=True))
+            through.objects.bulk_create([
+                through(recipe_id=recipe_id, **{target: keep})
+                for recipe_id in recipe_ids - linked
+            ])
+            model.objects.filter(id=pk).delete()
+
+    # Os nomes so mudam nos espacos, entao o search_vector continua igual;
+    # a contagem de ingredientes e as assinaturas dependem dos ids. O ETag
+    # e o Last-Modified do detalhe vem do updated_at, que precisa mudar
+    # com os nomes e ids embutidos nele
+    recipe_ids = sorted(affected_recipes)
+    for start in range(0, len(recipe_ids), 2000):
+        chunk = recipe_ids[start:start + 2000]
+        Recipe.objects.filter(id__in=chunk).update(updated_at=Now())
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE core_recipe SET ingredient_count = ('
+                'SELECT count(*) FROM core_recipe_ingredients l '
+                'WHERE l.recipe_id = core_recipe.id) '
+                'WHERE id = ANY(%s)', [chunk]
+            )
+        features = {pk: [] for pk in chunk}
+        for relation, target in (('tags', 'tag_id'),
+                                 ('ingredients', 'ingredient_id')):
+            through = Recipe._meta.get_field(relation).remote_field.through
+            links = through.objects.filter(recipe_id__in=chunk) \
+                .values_list('recipe_id', target)
+            for recipe_id, target_id in links:
+                features[recipe_id].append(
+                    similarity.feature(relation, target_id)
+                )
+        similarity.save_signatures(
+            schema_editor.connection, Recipe._meta.db_table, features
+        )
+
+    # Listas em cache ainda teriam os nomes antigos
+    for user_id in affected_users:
+        bump_data_version(user_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_recipe_image_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_names, migrations.RunPython.noop),
+    ]
@@ -1,14 +1,30 @@
 import uuid
 import os
 
-from django.db import models
+from django.core.exceptions import EmptyResultSet
+from django.db import connection, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.contrib.postgres.fields import ArrayField, JSONField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
     PermissionsMixin
 from django.conf import settings
 
+from core import similarity
+from core.cache import bump_data_version
+from core.storage import image_storage
+
+# Configuracao do PostgreSQL usada no search_vector e nas buscas
+SEARCH_CONFIG = 'english'
+
 
 def recipe_image_file_path(instance, filename):
-    """Gera um caminho para salvar foto da receita"""
+    """Gera um caminho para salvar foto da receita
+
+    O nome final vem do conteudo (core.storage); daqui so valem o
+    diretorio e a extensao."""
     ext = filename.split('.')[-1]
     filename = f'{uuid.uuid4()}.{ext}'
     return os.path.join('uploads/recipe/', filename)
@@ -34,6 +50,42 @@ class UserManager(BaseUserManager):
         return user
 
 
+class UserNameManager(models.Manager):
+    """Manager de objetos identificados por (usuario, nome)"""
+
+    @staticmethod
+    def normalize_name(name):
+        """Remove espacos extras do nome"""
+        return ' '.join(name.split())
+
+    def upsert_names(self, user, names):
+        """Garante um objeto por nome e retorna [(id, nome, criado)] na
+        ordem recebida, com um unico INSERT ... ON CONFLICT"""
+        names = list(dict.fromkeys(
+            name for name in map(self.normalize_name, names) if name
+        ))
+        if not names:
+            return []
+
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        with connection.cursor() as cursor:
+            # O DO UPDATE sem efeito faz o RETURNING incluir os nomes que
+            # ja existiam; xmax = 0 indica as linhas inseridas agora
+            cursor.execute(
+                f'INSERT INTO {table} (user_id, name) '
+                f'SELECT %s, unnest(%s::varchar[]) '
+                f'ON CONFLICT (user_id, name) '
+                f'DO UPDATE SET name = EXCLUDED.name '
+                f'RETURNING id, name, xmax = 0',
+                [user.pk, names]
+            )
+            rows = {row[1]: row for row in cursor.fetchall()}
+
+        # SQL puro nao dispara os signals de invalidacao
+        bump_data_version(user.pk)
+        return [rows[name] for name in names]
+
+
 class User(AbstractBaseUser, PermissionsMixin):
     """Custom user model that suports using email"""
     email = models.EmailField(max_length=255, unique=True)
@@ -54,6 +106,14 @@ class Tag(models.Model):
         on_delete=models.CASCADE,
     )
 
+    objects = UserNameManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'name'],
+                                    name='core_tag_user_name_uniq'),
+        ]
+
     def __str__(self) -> str:
         return self.name
 
@@ -66,10 +126,96 @@ class Ingredient(models.Model):
         on_delete=models.CASCADE,
     )
 
+    objects = UserNameManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'name'],
+                                    name='core_ingredient_user_name_uniq'),
+        ]
+
     def __str__(self) -> str:
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    search_weights = (('tags', 'B'), ('ingredients', 'C'))
+
+    def update_search_vector(self):
+        """Recalcula o search_vector das receitas do queryset a partir do
+        titulo (peso A), das tags (B) e dos ingredientes (C)"""
+        qn = connection.ops.quote_name
+        table = qn(self.model._meta.db_table)
+        parts = [f"setweight(to_tsvector(%s, {table}.title), 'A')"]
+        params = [SEARCH_CONFIG]
+        for relation, weight in self.search_weights:
+            field = self.model._meta.get_field(relation)
+            through = qn(field.remote_field.through._meta.db_table)
+            target = qn(field.related_model._meta.db_table)
+            recipe_column = qn(f'{field.m2m_field_name()}_id')
+            target_column = qn(f'{field.m2m_reverse_field_name()}_id')
+            parts.append(
+                f"setweight(to_tsvector(%s, coalesce(("
+                f"SELECT string_agg(t.name, ' ') FROM {target} t "
+                f"JOIN {through} l ON l.{target_column} = t.id "
+                f"WHERE l.{recipe_column} = {table}.id), '')), '{weight}')"
+            )
+            params.append(SEARCH_CONFIG)
+
+        try:
+            ids_sql, ids_params = self.values('pk').query.sql_with_params()
+        except EmptyResultSet:
+            # Ex.: pk__in=[] de uma tag apagada sem receitas
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {table} SET search_vector = {" || ".join(parts)} '
+                f'WHERE {table}.id IN ({ids_sql})',
+                params + list(ids_params)
+            )
+            return cursor.rowcount
+
+    def update_ingredient_count(self):
+        """Recalcula o ingredient_count das receitas do queryset"""
+        links = self.model.ingredients.through.objects \
+            .filter(recipe_id=OuterRef('pk')) \
+            .order_by().values('recipe_id') \
+            .annotate(count=Count('*')).values('count')
+        return self.update(ingredient_count=Coalesce(
+            Subquery(links, output_field=models.IntegerField()), 0
+        ))
+
+    def update_similarity_signature(self):
+        """Recalcula a assinatura MinHash e as chaves LSH das receitas do
+        queryset a partir dos ids das suas tags e ingredientes"""
+        features = {pk: [] for pk in self.values_list('pk', flat=True)}
+        if not features:
+            return 0
+        for relation in ('tags', 'ingredients'):
+            field = self.model._meta.get_field(relation)
+            target = f'{field.m2m_reverse_field_name()}_id'
+            links = field.remote_field.through.objects \
+                .filter(recipe_id__in=list(features)) \
+                .values_list('recipe_id', target)
+            for recipe_id, target_id in links:
+                features[recipe_id].append(
+                    similarity.feature(relation, target_id)
+                )
+
+        similarity.save_signatures(
+            connection, self.model._meta.db_table, features
+        )
+        return len(features)
+
+    def update_link_fields(self):
+        """Recalcula todos os campos derivados das tags e ingredientes,
+        para quem cria vinculos sem disparar os signals"""
+        self.update_search_vector()
+        self.update_ingredient_count()
+        self.update_similarity_signature()
+
+
 class Recipe(models.Model):
     """Receitas"""
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
@@ -80,7 +226,35 @@ class Recipe(models.Model):
     link = models.CharField(max_length=255, blank=True)
     ingredients = models.ManyToManyField('Ingredient')
     tags = models.ManyToManyField('Tag')
-    image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    image = models.ImageField(null=True, upload_to=recipe_image_file_path,
+                              storage=image_storage)
+    # {variante: caminho}, preenchido em segundo plano por core.images
+    image_variants = JSONField(default=dict, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Mantido pelos signals em core.signals, ver update_search_vector
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Mantido pelos signals em core.signals, usado no filtro cookable
+    ingredient_count = models.PositiveIntegerField(default=0, editable=False)
+    # Mantidos pelos signals em core.signals, ver core.similarity
+    minhash = ArrayField(models.IntegerField(), default=list, editable=False)
+    lsh_bands = ArrayField(models.BigIntegerField(), default=list,
+                           editable=False)
+
+    objects = RecipeQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'],
+                         name='core_recipe_user_id_idx'),
+            models.Index(fields=['user', 'price', 'id'],
+                         name='core_recipe_user_price_idx'),
+            models.Index(fields=['user', 'time_minutes', 'id'],
+                         name='core_recipe_user_time_idx'),
+            GinIndex(fields=['search_vector'],
+                     name='core_recipe_search_idx'),
+            GinIndex(fields=['lsh_bands'],
+                     name='core_recipe_lsh_bands_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -0,0 +1,88 @@
+import decimal
+import json
+
+from rest_framework import renderers
+from rest_framework.negotiation import BaseContentNegotiation
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - usa o json da stdlib
+    orjson = None
+
+
+class JSONEncoder(encoders.JSONEncoder):
+    """Encoder do DRF que mantem Decimals exatos, como string"""
+
+    def default(self, obj):
+        if isinstance(obj, decimal.Decimal):
+            return str(obj)
+        return super().default(obj)
+
+
+_encoder = JSONEncoder()
+
+if orjson is not None:
+    _ORJSON_OPTIONS = (
+        orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+    )
+
+    def dumps(data):
+        """Serializa `data` para JSON compacto em bytes"""
+        ret = orjson.dumps(data, default=_encoder.default,
+                           option=_ORJSON_OPTIONS)
+        # Mesmo escape do JSONRenderer do DRF para U+2028 e U+2029
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028') \
+            .replace(b'\xe2\x80\xa9', b'\\u2029')
+else:  # pragma: no cover
+    def dumps(data):
+        """Serializa `data` para JSON compacto em bytes"""
+        ret = json.dumps(data, cls=JSONEncoder, ensure_ascii=False,
+                         separators=(',', ':'))
+        return ret.replace('\u2028', '\\u2028') \
+            .replace('\u2029', '\\u2029').encode()
+
+
+def stream_list(items, chunk_size=500):
+    """Gera um array JSON em pedacos de `chunk_size` itens, sem montar
+    o corpo inteiro em memoria"""
+    yield b'['
+    chunk = []
+    first = True
+    for item in items:
+        chunk.append(dumps(item))
+        if len(chunk) == chunk_size:
+            yield (b'' if first else b',') + b','.join(chunk)
+            chunk, first = [], False
+    if chunk:
+        yield (b'' if first else b',') + b','.join(chunk)
+    yield b']'
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    """JSONRenderer que usa o orjson quando instalado
+
+    Respostas indentadas (ex: ?format=api) continuam com o json da
+    stdlib."""
+    encoder_class = JSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent is not None or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        return dumps(data)
+
+
+class IgnoreClientContentNegotiation(BaseContentNegotiation):
+    """Usa sempre o primeiro renderer, para acoes que respondem com
+    arquivos (ex: image/webp) e so usam o renderer nos erros"""
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
@@ -0,0 +1,141 @@
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, post_save, \
+    pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from core.authentication import token_cache
+from core.cache import bump_data_version
+from core.models import Tag, Ingredient, Recipe
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """Remove do cache o token apagado"""
+    token_cache.delete(instance.key)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_tokens(sender, instance, **kwargs):
+    """Remove do cache os tokens de um usuario alterado ou desativado"""
+    keys = Token.objects.filter(user_id=instance.pk) \
+        .values_list('key', flat=True)
+    for key in keys:
+        token_cache.delete(key)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+def bump_owner_data_version(sender, instance, **kwargs):
+    """Invalida os caches do dono do objeto alterado"""
+    bump_data_version(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def bump_links_data_version(sender, instance, action, **kwargs):
+    """Invalida os caches quando os vinculos de uma receita mudam"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_data_version(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def touch_recipes_on_links_change(sender, instance, action, reverse,
+                                  pk_set, **kwargs):
+    """Atualiza o updated_at das receitas cujos vinculos mudaram"""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            Recipe.objects.filter(pk=instance.pk) \
+                .update(updated_at=timezone.now())
+    elif action in ('post_add', 'post_remove'):
+        Recipe.objects.filter(pk__in=pk_set) \
+            .update(updated_at=timezone.now())
+    elif action == 'pre_clear':
+        instance.recipe_set.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def touch_recipes_on_attr_change(sender, instance, created=False, **kwargs):
+    """O detalhe da receita inclui tags e ingredientes, entao renomear
+    ou apagar um deles tambem altera as receitas vinculadas"""
+    if not created:
+        instance.recipe_set.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_vector(sender, instance, update_fields=None,
+                                **kwargs):
+    """Recalcula o search_vector quando o titulo pode ter mudado"""
+    if update_fields is None or 'title' in update_fields:
+        Recipe.objects.filter(pk=instance.pk).update_search_vector()
+
+
+def refresh_link_fields(recipes, model):
+    """Recalcula os campos das receitas derivados dos vinculos com
+    `model` (Tag ou Ingredient)"""
+    recipes.update_search_vector()
+    if model is Ingredient:
+        recipes.update_ingredient_count()
+    recipes.update_similarity_signature()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def update_fields_on_links_change(sender, instance, action, reverse,
+                                  pk_set, **kwargs):
+    """Recalcula os campos derivados das receitas cujos vinculos mudaram"""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            refresh_link_fields(
+                Recipe.objects.filter(pk=instance.pk), kwargs['model']
+            )
+    elif action in ('post_add', 'post_remove'):
+        refresh_link_fields(
+            Recipe.objects.filter(pk__in=pk_set), type(instance)
+        )
+    elif action == 'pre_clear':
+        # Depois do clear os vinculos nao existem mais
+        instance._linked_recipe_ids = list(
+            instance.recipe_set.values_list('pk', flat=True)
+        )
+    elif action == 'post_clear':
+        refresh_link_fields(
+            Recipe.objects.filter(pk__in=instance._linked_recipe_ids),
+            type(instance)
+        )
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def update_search_vector_on_rename(sender, instance, created, **kwargs):
+    """Recalcula o search_vector das receitas da tag ou ingrediente"""
+    if not created:
+        instance.recipe_set.update_search_vector()
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def collect_linked_recipes(sender, instance, **kwargs):
+    """Guarda as receitas vinculadas antes que os vinculos sejam apagados"""
+    instance._linked_recipe_ids = list(
+        instance.recipe_set.values_list('pk', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def update_fields_on_delete(sender, instance, **kwargs):
+    """Recalcula os campos derivados das receitas da tag ou ingrediente
+    apagado"""
+    refresh_link_fields(
+        Recipe.objects.filter(pk__in=instance._linked_recipe_ids), sender
+    )
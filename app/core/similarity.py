@@ -0,0 +1,72 @@
+import hashlib
+import random
+import struct
+
+from psycopg2.extras import execute_values
+
+# 16 bandas de 2 linhas: pares com Jaccard a partir de ~0.25 tendem a
+# cair em alguma banda em comum
+NUM_PERM = 32
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+_PRIME = (1 << 31) - 1
+# Semente fixa: as assinaturas ficam salvas no banco
+_random = random.Random(1020)
+_HASHES = [
+    (_random.randrange(1, _PRIME), _random.randrange(0, _PRIME))
+    for _ in range(NUM_PERM)
+]
+
+
+def feature(relation, pk):
+    """Elemento do conjunto da receita para uma tag ou ingrediente"""
+    return pk * 2 + (relation == 'ingredients')
+
+
+def signature(features):
+    """Assinatura MinHash do conjunto `features`, ou [] se vazio"""
+    features = set(features)
+    if not features:
+        return []
+    return [min((a * x + b) % _PRIME for x in features) for a, b in _HASHES]
+
+
+def band_keys(sig):
+    """Chaves LSH (int64) das bandas da assinatura"""
+    keys = []
+    for band in range(len(sig) // ROWS):
+        rows = sig[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(
+            struct.pack(f'>{ROWS + 1}I', band, *rows), digest_size=8
+        ).digest()
+        keys.append(struct.unpack('>q', digest)[0])
+    return keys
+
+
+def similarity(sig1, sig2):
+    """Estimativa da similaridade de Jaccard entre duas assinaturas"""
+    if not sig1 or len(sig1) != len(sig2):
+        return 0.0
+    return sum(a == b for a, b in zip(sig1, sig2)) / len(sig1)
+
+
+def save_signatures(connection, table, features):
+    """Grava assinatura e chaves LSH de {id da receita: features} em
+    `table` com um UPDATE ... FROM (VALUES ...) por pagina"""
+    rows = []
+    for pk, recipe_features in features.items():
+        sig = signature(recipe_features)
+        rows.append((pk, sig, band_keys(sig)))
+    table = connection.ops.quote_name(table)
+    with connection.cursor() as cursor:
+        execute_values(
+            cursor.cursor,
+            f'UPDATE {table} SET minhash = v.minhash, '
+            f'lsh_bands = v.lsh_bands '
+            f'FROM (VALUES %s) AS v (id, minhash, lsh_bands) '
+            f'WHERE {table}.id = v.id',
+            rows,
+            template='(%s, %s::integer[], %s::bigint[])',
+            page_size=1000
+        )
@@ -0,0 +1,59 @@
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+def content_hash(content):
+    """sha256 do arquivo; usa o calculado durante o upload quando existe
+    (core.uploads)"""
+    digest = getattr(content, 'sha256', None)
+    if digest:
+        return digest
+    sha256 = hashlib.sha256()
+    for chunk in content.chunks():
+        sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Storage que nomeia cada arquivo pelo sha256 do conteudo
+
+    O diretorio e a extensao vem do nome pedido (upload_to). Conteudo
+    repetido reaproveita o arquivo que ja existe, sem gravar de novo;
+    os arquivos sem nenhuma receita apontando sao apagados pelo comando
+    collect_images."""
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        digest = content_hash(content)
+        ext = os.path.splitext(name)[1].lower()
+        name = os.path.join(
+            os.path.dirname(name), digest[:2], f'{digest}{ext}'
+        )
+        if self.exists(name) and self.touch(name):
+            # Mesmo conteudo: o arquivo e compartilhado
+            return name
+        return super().save(name, content, max_length=max_length)
+
+    def save_as(self, name, content, max_length=None):
+        """Grava com o nome dado, sem o hash; para arquivos derivados de um
+        original ja nomeado pelo conteudo (as variantes de core.images)"""
+        return super().save(name, content, max_length=max_length)
+
+    def touch(self, name):
+        """Renova o mtime do arquivo que ganhou uma nova referencia, para
+        que o collect_images nao o apague antes do commit da receita
+
+        Retorna False se o arquivo nao existe mais."""
+        try:
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return False
+        return True
+
+
+image_storage = ContentAddressedStorage()
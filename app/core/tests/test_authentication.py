@@ -0,0 +1,86 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+
+from core.authentication import CachedTokenAuthentication, token_cache
+
+ME_URL = reverse('user:me')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+
+    def setUp(self) -> None:
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='test@gmail.com',
+            password='testpass',
+            name='name'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.auth = CachedTokenAuthentication()
+
+    def test_cached_token_skips_database(self):
+        """Testa que o token em cache nao consulta o banco"""
+        self.auth.authenticate_credentials(self.token.key)
+
+        with self.assertNumQueries(0):
+            user, token = self.auth.authenticate_credentials(self.token.key)
+
+        self.assertEqual(user, self.user)
+        self.assertEqual(token, self.token)
+
+    def test_deleted_token_invalidated(self):
+        """Testa que um token apagado deixa de autenticar"""
+        self.auth.authenticate_credentials(self.token.key)
+        self.token.delete()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_deactivated_user_invalidated(self):
+        """Testa que um usuario desativado deixa de autenticar"""
+        self.auth.authenticate_credentials(self.token.key)
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_user_update_invalidated(self):
+        """Testa que atualizar o usuario pelo me url renova o cache"""
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        client.get(ME_URL)
+
+        res = client.patch(ME_URL, {'name': 'novo_nome'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        res = client.get(ME_URL)
+        self.assertEqual(res.data['name'], 'novo_nome')
+
+    def test_lru_evicts_oldest(self):
+        """Testa que o cache descarta o token menos usado"""
+        self.addCleanup(setattr, token_cache, 'max_size', token_cache.max_size)
+        token_cache.max_size = 1
+        token_cache.set('a', (self.user, self.token))
+        token_cache.set('b', (self.user, self.token))
+
+        self.assertIsNone(token_cache.get('a'))
+        self.assertIsNotNone(token_cache.get('b'))
+
+    def test_local_entry_expires_after_ttl(self):
+        """Testa que a entrada do LRU em memoria expira no TTL, o limite
+        para um token revogado por outro processo"""
+        self.assertLessEqual(token_cache.ttl, 5)
+        with patch('core.authentication.time.monotonic', return_value=100):
+            token_cache.set('a', (self.user, self.token))
+        with patch('core.authentication.time.monotonic',
+                   return_value=100 + token_cache.ttl):
+            self.assertIsNone(token_cache.get('a'))
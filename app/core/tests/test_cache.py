@@ -0,0 +1,28 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from core.cache import data_version
+from core.models import Tag
+from core.tests.utils import capture_on_commit_callbacks
+
+
+class DataVersionTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'cache@gmail.com', 'testpass'
+        )
+
+    def test_bump_after_commit(self):
+        """Testa que a versao so muda depois do commit, para uma listagem
+        concorrente nao guardar as linhas antigas na chave nova"""
+        version = data_version(self.user.id)
+
+        with capture_on_commit_callbacks() as callbacks:
+            tag = Tag.objects.create(user=self.user, name='Vegan')
+            tag.delete()
+
+        self.assertEqual(data_version(self.user.id), version)
+        for callback in callbacks:
+            callback()
+        self.assertGreater(data_version(self.user.id), version)
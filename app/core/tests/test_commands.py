@@ -1,10 +1,23 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
 from unittest.mock import patch
 
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import CommandError
 
 from django.db.utils import OperationalError
 from django.test import TestCase
 
+from core.cache import data_version
+from core.models import Tag, Recipe
+from core.tests.utils import capture_on_commit_callbacks
+
 
 class CommandTests(TestCase):
 
@@ -22,3 +35,169 @@ class CommandTests(TestCase):
             gi.side_effect = [OperationalError] * 5 + [True]
             call_command('wait_for_db')
             self.assertEqual(gi.call_count, 6)
+
+
+class ImportRecipesCommandTests(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            'import@gmail.com', 'testpass'
+        )
+
+    def _write(self, suffix, content):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w') as fp:
+            fp.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_import_csv(self):
+        """Testa a importacao de um CSV com tags e ingredientes"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        path = self._write('.csv', (
+            'title,time_minutes,price,link,tags,ingredients\n'
+            'Salada,10,5.50,,Vegan|Quick,Alface|Tomate\n'
+            'Sopa,30,8.00,http://sopa,Vegan,Tomate\n'
+        ))
+
+        out = StringIO()
+        call_command('import_recipes', path, user=self.user.email,
+                     batch_size=1, stdout=out)
+
+        self.assertIn('Imported 2 recipes', out.getvalue())
+        salada = Recipe.objects.get(user=self.user, title='Salada')
+        self.assertEqual(
+            sorted(salada.tags.values_list('name', flat=True)),
+            ['Quick', 'Vegan']
+        )
+        self.assertIn(tag, salada.tags.all())
+        sopa = Recipe.objects.get(user=self.user, title='Sopa')
+        self.assertEqual(sopa.link, 'http://sopa')
+        self.assertEqual(
+            list(sopa.ingredients.values_list('name', flat=True)),
+            ['Tomate']
+        )
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+
+    def test_import_jsonl(self):
+        """Testa a importacao de um JSONL"""
+        path = self._write('.jsonl', json.dumps({
+            'title': 'Bolo', 'time_minutes': 40, 'price': '12.00',
+            'tags': ['Dessert'], 'ingredients': ['Farinha', 'Ovo'],
+        }) + '\n')
+
+        call_command('import_recipes', path, user=self.user.email,
+                     stdout=StringIO())
+
+        recipe = Recipe.objects.get(user=self.user)
+        self.assertEqual(recipe.ingredients.count(), 2)
+        self.assertEqual(recipe.tags.get().name, 'Dessert')
+
+    def test_import_invalid_record(self):
+        """Testa que um registro invalido interrompe a importacao"""
+        path = self._write('.csv', 'title,time_minutes,price\nX,abc,1\n')
+
+        with self.assertRaises(CommandError):
+            call_command('import_recipes', path, user=self.user.email,
+                         stdout=StringIO())
+
+    def test_import_reports_invalid_line(self):
+        """Testa que linhas invalidas sao recusadas com o numero da linha,
+        antes de chegar ao banco"""
+        cases = [
+            ('.jsonl', '{"title": "Bolo"\n'),
+            ('.jsonl', '["Bolo", 10, "1.00"]\n'),
+            ('.csv', 'title,time_minutes,price\n' + 'x' * 256 + ',10,1\n'),
+            ('.csv', 'title,time_minutes,price\nBolo,-1,1\n'),
+            ('.csv', 'title,time_minutes,price\nBolo,10,1000.00\n'),
+            ('.csv', 'title,time_minutes,price\nBolo,10,1.001\n'),
+            ('.csv', 'title,time_minutes,price,tags\nBolo,10,1,' +
+             'x' * 256 + '\n'),
+            ('.csv', 'title,time_minutes,price\nBolo\n'),
+            ('.jsonl', '{"title": "Bolo", "time_minutes": null, '
+             '"price": "1.00"}\n'),
+            ('.jsonl', '{"title": "Bolo", "time_minutes": 10, '
+             '"price": "1.00", "tags": 5}\n'),
+            ('.jsonl', '{"title": "Bolo", "time_minutes": 10, '
+             '"price": "1.00", "tags": [1]}\n'),
+        ]
+        for suffix, content in cases:
+            with self.subTest(content=content[:40]):
+                path = self._write(suffix, content)
+                with self.assertRaisesRegex(CommandError, r'^Line \d+: '):
+                    call_command('import_recipes', path, user=self.user.email,
+                                 stdout=StringIO())
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_import_bumps_version_per_batch(self):
+        """Testa que os lotes ja gravados invalidam o cache mesmo se um
+        lote seguinte falhar"""
+        path = self._write('.csv', (
+            'title,time_minutes,price\n'
+            'Salada,10,5.50\n'
+            'Sopa,abc,8.00\n'
+        ))
+        version = data_version(self.user.id)
+
+        with capture_on_commit_callbacks(execute=True):
+            with self.assertRaises(CommandError):
+                call_command('import_recipes', path, user=self.user.email,
+                             batch_size=1, stdout=StringIO())
+
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 1)
+        self.assertGreater(data_version(self.user.id), version)
+
+
+class CollectImagesCommandTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings = self.settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        user = get_user_model().objects.create_user('gc@gmail.com', 'pass')
+        self.recipes = [
+            Recipe.objects.create(user=user, title=title, time_minutes=5,
+                                  price=5)
+            for title in ('Bolo', 'Torta')
+        ]
+
+    def _upload(self, recipe, content):
+        recipe.image.save('foto.jpg', ContentFile(content))
+        return recipe.image.name
+
+    def _collect(self, **options):
+        out = StringIO()
+        options.setdefault('min_age', 0)
+        call_command('collect_images', stdout=out, **options)
+        return out.getvalue()
+
+    def test_keeps_shared_and_removes_orphans(self):
+        """Testa que so os arquivos sem referencia sao apagados"""
+        shared = self._upload(self.recipes[0], b'igual')
+        self.assertEqual(self._upload(self.recipes[1], b'igual'), shared)
+        old = self._upload(self.recipes[0], b'antiga')
+        self._upload(self.recipes[0], b'nova')
+        variant = 'uploads/recipe/variant_thumb.webp'
+        default_storage.save(variant, ContentFile(b'webp'))
+        Recipe.objects.filter(pk=self.recipes[1].pk) \
+            .update(image_variants={'thumb': variant})
+
+        out = self._collect()
+
+        self.assertIn('Removed 1 files', out)
+        self.assertFalse(default_storage.exists(old))
+        self.assertTrue(default_storage.exists(shared))
+        self.assertTrue(default_storage.exists(variant))
+        self.assertTrue(default_storage.exists(self.recipes[0].image.name))
+
+    def test_dry_run_and_min_age(self):
+        """Testa que --dry-run e arquivos recentes nao sao apagados"""
+        orphan = self._upload(self.recipes[0], b'orfa')
+        Recipe.objects.update(image='')
+
+        self.assertIn('Removed 0 files', self._collect(min_age=3600))
+        self.assertIn(orphan, self._collect(dry_run=True))
+        self.assertTrue(default_storage.exists(orphan))
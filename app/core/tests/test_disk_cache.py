@@ -0,0 +1,44 @@
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase
+
+from core.disk_cache import DiskLRUCache
+
+
+class DiskLRUCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.cache = DiskLRUCache(self.directory, max_bytes=30)
+
+    def _age(self, key, mtime):
+        os.utime(self.cache.path(key), (mtime, mtime))
+
+    def test_put_and_open(self):
+        """Testa que o conteudo gravado eh lido de volta"""
+        self.assertIsNone(self.cache.open('a'))
+
+        self.cache.put('a', b'0123456789')
+
+        with self.cache.open('a') as fp:
+            self.assertEqual(fp.read(), b'0123456789')
+
+    def test_evicts_least_recently_used(self):
+        """Testa que passar do limite apaga os menos usados"""
+        for mtime, key in enumerate(('a', 'b', 'c'), start=1):
+            self.cache.put(key, b'x' * 10)
+            self._age(key, mtime)
+        # Um acerto torna 'a' o mais recente
+        self.cache.open('a').close()
+
+        self.cache.put('d', b'x' * 10)
+
+        self.assertIsNone(self.cache.open('b'))
+        self.assertIsNone(self.cache.open('c'))
+        for key in ('a', 'd'):
+            fp = self.cache.open(key)
+            self.assertIsNotNone(fp)
+            fp.close()
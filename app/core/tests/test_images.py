@@ -0,0 +1,110 @@
+import io
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from core import images
+from core.models import Recipe
+from core.storage import image_storage
+
+
+def sample_image(size=(1200, 600), format='JPEG'):
+    """Retorna os bytes de uma imagem"""
+    buf = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buf, format)
+    return buf.getvalue()
+
+
+@override_settings(RECIPE_IMAGE_VARIANTS={'thumb': 100, 'medium': 400})
+class ImageVariantsTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'teste@gmail.com', 'testpass'
+        )
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Bolo', time_minutes=10, price=5
+        )
+        self.recipe.image.save('bolo.jpg', ContentFile(sample_image()))
+
+    def tearDown(self):
+        for name in self.recipe.image_variants.values():
+            image_storage.delete(name)
+        self.recipe.image.delete()
+
+    def test_generate_variants(self):
+        """Testa a geracao das variantes WebP da imagem"""
+        images.generate_variants(
+            self.recipe.id, self.user.id, self.recipe.image.name
+        )
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants, {
+            variant: images.variant_name(self.recipe.image.name, variant)
+            for variant in ('thumb', 'medium')
+        })
+        with image_storage.open(self.recipe.image_variants['thumb']) as fp:
+            with Image.open(fp) as img:
+                self.assertEqual(img.format, 'WEBP')
+                self.assertEqual(img.size, (100, 50))
+
+    def test_generate_variants_of_replaced_image(self):
+        """Testa que variantes de uma imagem substituida sao ignoradas"""
+        name = self.recipe.image.name
+        Recipe.objects.filter(pk=self.recipe.pk).update(image='other.jpg')
+
+        variants = images.generate_variants(self.recipe.id, self.user.id,
+                                            name)
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants, {})
+        for path in variants.values():
+            image_storage.delete(path)
+        self.recipe.image.name = name
+
+    def test_generate_variants_of_invalid_image(self):
+        """Testa que uma imagem que nao abre e registrada no log"""
+        name = self.recipe.image.name
+        Recipe.objects.filter(pk=self.recipe.pk).update(image='missing.jpg')
+
+        with self.assertLogs('core.images', 'ERROR'):
+            variants = images.generate_variants(
+                self.recipe.id, self.user.id, 'missing.jpg'
+            )
+
+        self.assertEqual(variants, {})
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants, {})
+        self.recipe.image.name = name
+
+    def test_enqueue_variants_after_commit(self):
+        """Testa que a geracao vai para o pool de threads"""
+        with patch.object(images, '_get_executor') as get_executor:
+            with patch('django.db.transaction.on_commit',
+                       lambda func: func()):
+                images.enqueue_variants(self.recipe)
+
+        get_executor.return_value.submit.assert_called_once_with(
+            images._run, self.recipe.id, self.user.id, self.recipe.image.name
+        )
+
+
+class RenderWidthTests(TestCase):
+
+    def test_render_width_rotated_jpeg(self):
+        """Testa a largura de um JPEG girado pelo EXIF (orientacao 6),
+        que e decodificado em escala reduzida"""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        buf = io.BytesIO()
+        Image.new('RGB', (800, 400), 'red').save(buf, 'JPEG',
+                                                 exif=exif.tobytes())
+        buf.seek(0)
+
+        data = images.render_width(buf, 100)
+
+        with Image.open(io.BytesIO(data)) as img:
+            self.assertEqual(img.size, (100, 200))
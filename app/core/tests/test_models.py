@@ -1,3 +1,4 @@
+from django.db import connection
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from unittest.mock import patch
@@ -84,3 +85,26 @@ class ModelTests(TestCase):
         exp_path = f'uploads/recipe/{uuid}.jpg'
 
         self.assertEqual(file_path, exp_path)
+
+    def test_reverse_join_table_indexes(self):
+        """Testa que as tabelas m2m tem indice no sentido inverso"""
+        expected = {
+            'core_recipe_tags': ['tag_id', 'recipe_id'],
+            'core_recipe_ingredients': ['ingredient_id', 'recipe_id'],
+        }
+        with connection.cursor() as cursor:
+            for table, columns in expected.items():
+                constraints = connection.introspection.get_constraints(
+                    cursor, table
+                )
+                indexed = [c['columns'] for c in constraints.values()
+                           if c['index']]
+                self.assertIn(columns, indexed)
+
+    def test_delete_unused_tag(self):
+        """Testa apagar uma tag sem receitas vinculadas"""
+        tag = models.Tag.objects.create(user=sample_user(), name='Vegan')
+
+        tag.delete()
+
+        self.assertFalse(models.Tag.objects.exists())
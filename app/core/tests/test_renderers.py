@@ -0,0 +1,54 @@
+import datetime
+import json
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer as DRFJSONRenderer
+
+from core.renderers import JSONRenderer, dumps, stream_list
+
+
+class RendererTests(SimpleTestCase):
+
+    def test_render_matches_drf(self):
+        """Testa que a saida eh igual a do JSONRenderer do DRF"""
+        data = OrderedDict([
+            ('id', 1),
+            ('title', 'Pão de queijo \u2028'),
+            ('tags', [1, 2]),
+            ('price', '5.50'),
+            ('created', datetime.datetime(2020, 1, 2, 3, 4, 5,
+                                          tzinfo=timezone.utc)),
+            ('link', None),
+        ])
+
+        self.assertEqual(
+            JSONRenderer().render(data),
+            DRFJSONRenderer().render(data)
+        )
+
+    def test_render_decimal_as_string(self):
+        """Testa que decimais sao renderizados sem perder precisao"""
+        res = JSONRenderer().render({'price': Decimal('10.10')})
+
+        self.assertEqual(json.loads(res), {'price': '10.10'})
+
+    def test_render_indented(self):
+        """Testa que o indent pedido pelo cliente eh respeitado"""
+        res = JSONRenderer().render(
+            {'id': 1}, 'application/json; indent=4'
+        )
+
+        self.assertEqual(res, b'{\n    "id": 1\n}')
+
+    def test_stream_list(self):
+        """Testa que o array gerado em pedacos eh o mesmo JSON"""
+        items = [{'id': i} for i in range(7)]
+
+        chunks = list(stream_list(items, chunk_size=3))
+
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(b''.join(chunks), dumps(items))
+        self.assertEqual(b''.join(stream_list([])), b'[]')
@@ -0,0 +1,41 @@
+from django.test import SimpleTestCase
+
+from core import similarity
+
+
+class SimilarityTests(SimpleTestCase):
+
+    def test_signature_identical_sets(self):
+        """Testa que conjuntos iguais tem a mesma assinatura e chaves"""
+        sig1 = similarity.signature([1, 2, 3])
+        sig2 = similarity.signature([3, 2, 1, 1])
+
+        self.assertEqual(len(sig1), similarity.NUM_PERM)
+        self.assertEqual(sig1, sig2)
+        self.assertEqual(similarity.similarity(sig1, sig2), 1.0)
+        self.assertEqual(len(similarity.band_keys(sig1)), similarity.BANDS)
+
+    def test_signature_empty_set(self):
+        """Testa que receitas sem tags e ingredientes nao tem chaves"""
+        sig = similarity.signature([])
+
+        self.assertEqual(sig, [])
+        self.assertEqual(similarity.band_keys(sig), [])
+        self.assertEqual(similarity.similarity(sig, sig), 0.0)
+
+    def test_similarity_estimates_jaccard(self):
+        """Testa que a estimativa fica perto do Jaccard verdadeiro"""
+        set1 = set(range(0, 100))
+        set2 = set(range(50, 150))
+        jaccard = len(set1 & set2) / len(set1 | set2)
+
+        estimate = similarity.similarity(
+            similarity.signature(set1), similarity.signature(set2)
+        )
+
+        self.assertAlmostEqual(estimate, jaccard, delta=0.2)
+
+    def test_feature_distinguishes_relations(self):
+        """Testa que tag e ingrediente com o mesmo id sao diferentes"""
+        self.assertNotEqual(similarity.feature('tags', 1),
+                            similarity.feature('ingredients', 1))
@@ -0,0 +1,59 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase
+
+from core.storage import ContentAddressedStorage
+
+
+class ContentAddressedStorageTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.storage = ContentAddressedStorage(location=self.directory)
+
+    def test_name_from_content(self):
+        """Testa que o nome vem do sha256 do conteudo"""
+        digest = hashlib.sha256(b'foto').hexdigest()
+
+        name = self.storage.save('uploads/recipe/x.JPG', ContentFile(b'foto'))
+
+        self.assertEqual(name, f'uploads/recipe/{digest[:2]}/{digest}.jpg')
+        with self.storage.open(name) as fp:
+            self.assertEqual(fp.read(), b'foto')
+
+    def test_same_content_shares_file(self):
+        """Testa que conteudo repetido reaproveita o arquivo"""
+        first = self.storage.save('uploads/a.jpg', ContentFile(b'foto'))
+        second = self.storage.save('uploads/b.jpg', ContentFile(b'foto'))
+        other = self.storage.save('uploads/c.jpg', ContentFile(b'outra'))
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertEqual(len(self.storage.listdir('uploads')[0]), 2)
+
+    def test_same_content_refreshes_mtime(self):
+        """Testa que reaproveitar um arquivo renova o mtime, para o
+        collect_images nao apagar um arquivo antigo que voltou a ser usado"""
+        name = self.storage.save('uploads/a.jpg', ContentFile(b'foto'))
+        os.utime(self.storage.path(name), (1000, 1000))
+
+        self.storage.save('uploads/b.jpg', ContentFile(b'foto'))
+
+        self.assertGreater(os.stat(self.storage.path(name)).st_mtime,
+                           time.time() - 60)
+
+    def test_uses_hash_from_upload(self):
+        """Testa que o sha256 calculado no upload e usado"""
+        upload = SimpleUploadedFile('a.jpg', b'foto')
+        upload.sha256 = 'ab' * 32
+
+        name = self.storage.save('uploads/a.jpg', upload)
+
+        self.assertEqual(name, f'uploads/ab/{"ab" * 32}.jpg')
@@ -0,0 +1,71 @@
+import hashlib
+import io
+
+from django.core.files.uploadhandler import StopFutureHandlers
+from django.test import SimpleTestCase, override_settings
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+
+from core.uploads import HashingMemoryFileUploadHandler, \
+    ImageUploadHandler, UploadTooLarge
+
+
+class HashingUploadHandlerTests(SimpleTestCase):
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=1024)
+    def test_hash_while_receiving(self):
+        """Testa que o handler calcula o sha256 dos chunks recebidos"""
+        handler = HashingMemoryFileUploadHandler()
+        handler.handle_raw_input(None, {}, 10, 'boundary')
+        with self.assertRaises(StopFutureHandlers):
+            handler.new_file('image', 'a.jpg', 'image/jpeg', 10)
+        handler.receive_data_chunk(b'01234', 0)
+        handler.receive_data_chunk(b'56789', 5)
+
+        file = handler.file_complete(10)
+
+        self.assertEqual(file.sha256,
+                         hashlib.sha256(b'0123456789').hexdigest())
+
+
+@override_settings(RECIPE_IMAGE_MAX_BYTES=100 * 1024,
+                   RECIPE_IMAGE_MAX_PIXELS=99,
+                   DATA_UPLOAD_MAX_MEMORY_SIZE=1024)
+class ImageUploadHandlerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.handler = ImageUploadHandler()
+        self.handler.new_file('image', 'a.png', 'image/png', None)
+        self.addCleanup(self.handler.file.close)
+
+    def test_content_length_too_large(self):
+        """Testa a recusa pelo Content-Length, antes de ler o corpo"""
+        with self.assertRaises(UploadTooLarge):
+            self.handler.handle_raw_input(None, {}, 102 * 1024, 'boundary')
+
+    def test_bytes_too_large(self):
+        """Testa a recusa no chunk que passa do limite"""
+        self.handler.receive_data_chunk(b'0' * 60 * 1024, 0)
+
+        with self.assertRaises(UploadTooLarge):
+            self.handler.receive_data_chunk(b'0' * 60 * 1024, 60 * 1024)
+
+    def test_pixels_checked_from_header(self):
+        """Testa que o cabecalho e checado assim que chega, antes do resto
+        do arquivo"""
+        buf = io.BytesIO()
+        Image.new('RGB', (10, 10)).save(buf, format='PNG')
+        chunk = buf.getvalue().ljust(ImageUploadHandler.header_size, b'\0')
+
+        with self.assertRaises(ValidationError) as cm:
+            self.handler.receive_data_chunk(chunk, 0)
+        self.assertIn('image', cm.exception.detail)
+
+    def test_not_an_image_header_is_accepted(self):
+        """Testa que um cabecalho nao reconhecido fica para o serializer"""
+        chunk = b'0' * ImageUploadHandler.header_size
+
+        self.handler.receive_data_chunk(chunk, 0)
+        file = self.handler.file_complete(len(chunk))
+
+        self.assertEqual(file.size, len(chunk))
@@ -0,0 +1,148 @@
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from core.views import parse_range
+
+DIGEST = 'ab' * 32
+
+
+class ParseRangeTests(SimpleTestCase):
+
+    def test_ranges(self):
+        """Testa a leitura do header Range"""
+        self.assertEqual(parse_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(parse_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=50-500', 100), (50, 99))
+        self.assertIsNone(parse_range('bytes=0-1,5-9', 100))
+        self.assertIsNone(parse_range('items=0-9', 100))
+        self.assertIsNone(parse_range('bytes=5-3', 100))
+        self.assertIsNone(parse_range('bytes=500-3', 100))
+        with self.assertRaises(ValueError):
+            parse_range('bytes=100-', 100)
+
+
+class ServeMediaTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        media_settings = override_settings(
+            MEDIA_ROOT=self.media, MEDIA_SENDFILE='', MEDIA_CACHE_MAX_AGE=60
+        )
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        self.name = f'uploads/recipe/ab/{DIGEST}.jpg'
+        self.content = bytes(range(256)) * 4
+        os.makedirs(os.path.join(self.media, 'uploads/recipe/ab'))
+        with open(os.path.join(self.media, self.name), 'wb') as fp:
+            fp.write(self.content)
+        self.url = reverse('media', args=[self.name])
+
+    def test_serve_file(self):
+        """Testa o arquivo inteiro com ETag e cache imutavel"""
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(b''.join(res.streaming_content), self.content)
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertEqual(res['Content-Length'], str(len(self.content)))
+        self.assertEqual(res['ETag'], f'"{DIGEST}"')
+        self.assertIn('immutable', res['Cache-Control'])
+        self.assertEqual(res['Accept-Ranges'], 'bytes')
+
+    def test_not_modified(self):
+        """Testa o 304 com If-None-Match"""
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=f'"{DIGEST}"')
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res['ETag'], f'"{DIGEST}"')
+
+    def test_range(self):
+        """Testa uma faixa de bytes"""
+        res = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+
+        self.assertEqual(res.status_code, 206)
+        self.assertEqual(b''.join(res.streaming_content), self.content[10:20])
+        self.assertEqual(res['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(res['Content-Length'], '10')
+
+    def test_range_not_satisfiable(self):
+        """Testa o 416 de uma faixa fora do arquivo"""
+        res = self.client.get(self.url, HTTP_RANGE='bytes=5000-')
+
+        self.assertEqual(res.status_code, 416)
+        self.assertEqual(res['Content-Range'], 'bytes */1024')
+
+    def test_range_invalid(self):
+        """Testa que uma faixa invalida e ignorada e devolve o arquivo
+        inteiro"""
+        res = self.client.get(self.url, HTTP_RANGE='bytes=5-3')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(b''.join(res.streaming_content), self.content)
+
+    def test_if_range_mismatch(self):
+        """Testa que If-Range de outra versao devolve o arquivo inteiro"""
+        res = self.client.get(self.url, HTTP_RANGE='bytes=10-19',
+                              HTTP_IF_RANGE='"outra"')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(b''.join(res.streaming_content), self.content)
+
+    def test_mutable_name_cache(self):
+        """Testa o ETag e o max-age de arquivos com nome qualquer"""
+        with open(os.path.join(self.media, 'outro.jpg'), 'wb') as fp:
+            fp.write(b'x')
+
+        res = self.client.get(reverse('media', args=['outro.jpg']))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertRegex(res['ETag'], r'^"[0-9a-f]{40}"$')
+        self.assertEqual(res['Cache-Control'], 'public, max-age=60')
+
+    def test_outside_media_root(self):
+        """Testa que caminhos fora do MEDIA_ROOT e diretorios dao 404"""
+        self.assertEqual(
+            self.client.get('/media/../settings.py').status_code, 404
+        )
+        self.assertEqual(
+            self.client.get(reverse('media', args=['uploads'])).status_code,
+            404
+        )
+
+    @override_settings(MEDIA_SENDFILE='x-accel-redirect',
+                       MEDIA_ACCEL_REDIRECT_PREFIX='/protected/')
+    def test_x_accel_redirect(self):
+        """Testa que a entrega fica com o nginx"""
+        res = self.client.get(self.url, HTTP_RANGE='bytes=0-9')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res['X-Accel-Redirect'], f'/protected/{self.name}')
+        self.assertEqual(res.content, b'')
+        self.assertEqual(res['ETag'], f'"{DIGEST}"')
+
+    @override_settings(MEDIA_SENDFILE='x-accel-redirect',
+                       MEDIA_ACCEL_REDIRECT_PREFIX='/protected/')
+    def test_x_accel_redirect_quoted(self):
+        """Testa que nomes com espacos e acentos vao codificados"""
+        with open(os.path.join(self.media, 'pão de queijo.jpg'), 'wb') as fp:
+            fp.write(b'x')
+
+        res = self.client.get(reverse('media', args=['pão de queijo.jpg']))
+
+        self.assertEqual(res['X-Accel-Redirect'],
+                         '/protected/p%C3%A3o%20de%20queijo.jpg')
+
+    @override_settings(MEDIA_SENDFILE='x-sendfile')
+    def test_x_sendfile(self):
+        """Testa o header X-Sendfile com o caminho do arquivo"""
+        res = self.client.get(self.url)
+
+        self.assertEqual(res['X-Sendfile'],
+                         os.path.join(self.media, self.name))
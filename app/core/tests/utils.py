@@ -0,0 +1,23 @@
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+@contextmanager
+def capture_on_commit_callbacks(using=DEFAULT_DB_ALIAS, execute=False):
+    """Captura os transaction.on_commit agendados dentro do bloco e, com
+    execute=True, roda todos ao sair, como se tivesse havido o commit
+
+    O TestCase nunca faz commit; e o captureOnCommitCallbacks do Django
+    3.2."""
+    callbacks = []
+    start = len(connections[using].run_on_commit)
+    try:
+        yield callbacks
+    finally:
+        callbacks[:] = [
+            func for _, func in connections[using].run_on_commit[start:]
+        ]
+        if execute:
+            for callback in callbacks:
+                callback()
@@ -0,0 +1,101 @@
+import hashlib
+import io
+
+from django.conf import settings
+from django.core.files.uploadhandler import MemoryFileUploadHandler, \
+    TemporaryFileUploadHandler
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from core import images
+
+
+class HashingUploadMixin:
+    """Calcula o sha256 do arquivo enquanto o upload e recebido e
+    guarda em `file.sha256` (usado pelo core.storage)"""
+
+    def new_file(self, *args, **kwargs):
+        # Antes do super(): o MemoryFileUploadHandler termina o new_file
+        # com StopFutureHandlers
+        self.sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        remaining = super().receive_data_chunk(raw_data, start)
+        if remaining is None:
+            # O chunk ficou com este handler
+            self.sha256.update(raw_data)
+        return remaining
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin,
+                                     MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin,
+                                        TemporaryFileUploadHandler):
+    pass
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Upload is too large.'
+    default_code = 'too_large'
+
+
+class ImageUploadHandler(HashingTemporaryFileUploadHandler):
+    """Recebe imagens direto num arquivo temporario, com memoria constante
+
+    Recusa o upload assim que passa de RECIPE_IMAGE_MAX_BYTES (ou ja pelo
+    Content-Length) e, ao receber os primeiros `header_size` bytes, le o
+    cabecalho da imagem para recusar as que tem pixels demais, sem ler o
+    resto do corpo."""
+    header_size = 64 * 1024
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        # Alem do arquivo o corpo so tem os outros campos do form, que o
+        # Django ja limita em DATA_UPLOAD_MAX_MEMORY_SIZE
+        limit = settings.RECIPE_IMAGE_MAX_BYTES + \
+            (settings.DATA_UPLOAD_MAX_MEMORY_SIZE or 0)
+        if content_length > limit:
+            self._too_large()
+
+    def new_file(self, *args, **kwargs):
+        self.header = bytearray()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.RECIPE_IMAGE_MAX_BYTES:
+            self.file.close()
+            self._too_large()
+        if self.header is not None:
+            self.header += raw_data[:self.header_size - len(self.header)]
+            if len(self.header) >= self.header_size:
+                self._check_header()
+        return super().receive_data_chunk(raw_data, start)
+
+    def _check_header(self):
+        header, self.header = self.header, None
+        try:
+            images.check_image(io.BytesIO(header))
+        except images.InvalidImage:
+            # Cabecalho maior que header_size ou nao e imagem: fica para a
+            # validacao do serializer, com o arquivo inteiro
+            pass
+        except images.ImageTooLarge as exc:
+            self.file.close()
+            raise ValidationError({self.field_name: [str(exc)]})
+
+    @staticmethod
+    def _too_large():
+        raise UploadTooLarge(
+            f'Upload is larger than {settings.RECIPE_IMAGE_MAX_BYTES} bytes.'
+        )
@@ -0,0 +1,161 @@
+import hashlib
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, \
+    StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+# Nome dado pelo sha256 do conteudo (core.storage): nunca muda
+CONTENT_HASH_RE = re.compile(r'^(?P<digest>[0-9a-f]{64})(\.\w+)?$')
+RANGE_RE = re.compile(r'^bytes=(?P<start>\d*)-(?P<end>\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def media_etag(name, st):
+    """ETag forte do arquivo: o proprio hash, se o nome vier do conteudo,
+    senao derivado de inode, tamanho e mtime"""
+    match = CONTENT_HASH_RE.match(os.path.basename(name))
+    if match:
+        return f'"{match.group("digest")}"'
+    key = f'{st.st_ino}-{st.st_size}-{st.st_mtime_ns}'
+    return f'"{hashlib.sha1(key.encode()).hexdigest()}"'
+
+
+def parse_range(header, size):
+    """(inicio, fim) inclusivos do header Range, None para servir o
+    arquivo inteiro ou ValueError se a faixa nao cabe no arquivo
+
+    Mais de uma faixa e atendida com o arquivo inteiro, como a RFC 7233
+    permite; uma faixa com o fim antes do inicio e invalida e o header e
+    ignorado."""
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match or match.group('start') == match.group('end') == '':
+        return None
+    start, end = match.group('start'), match.group('end')
+    if start == '':
+        # bytes=-N: os ultimos N bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError(header)
+        return max(0, size - length), size - 1
+    start = int(start)
+    if end and int(end) < start:
+        return None
+    if start >= size:
+        raise ValueError(header)
+    end = min(int(end), size - 1) if end else size - 1
+    return start, end
+
+
+def _if_range_matches(request, etag, mtime):
+    """Se o Range deve ser atendido, conforme o If-Range"""
+    value = request.META.get('HTTP_IF_RANGE')
+    if not value:
+        return True
+    if value.startswith('"'):
+        return value == etag
+    return parse_http_date_safe(value) == int(mtime)
+
+
+def _read_range(fp, start, length):
+    with fp:
+        fp.seek(start)
+        while length > 0:
+            chunk = fp.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _offload(response, name, path):
+    """Entrega o arquivo pelo proxy (X-Accel-Redirect do nginx ou
+    X-Sendfile do Apache), que tambem atende os Ranges
+
+    Os dois decodificam o valor do header como URL, entao nomes com
+    espacos ou fora do ASCII vao com quote()."""
+    if settings.MEDIA_SENDFILE == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = \
+            quote(settings.MEDIA_ACCEL_REDIRECT_PREFIX + name)
+    else:
+        response['X-Sendfile'] = quote(path)
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """Serve os arquivos de MEDIA_ROOT com ETag forte, Cache-Control e
+    Range, ou passa a entrega para o proxy (MEDIA_SENDFILE)"""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        st = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        raise Http404
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404
+
+    etag = media_etag(path, st)
+    immutable = CONTENT_HASH_RE.match(os.path.basename(path)) is not None
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+
+    def set_headers(response):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(st.st_mtime)
+        response['Accept-Ranges'] = 'bytes'
+        if immutable:
+            patch_cache_control(response, public=True, immutable=True,
+                                max_age=365 * 24 * 60 * 60)
+        else:
+            patch_cache_control(response, public=True,
+                                max_age=settings.MEDIA_CACHE_MAX_AGE)
+        if encoding:
+            response['Content-Encoding'] = encoding
+        return response
+
+    # 304 / 412 pelos headers condicionais, so com o stat
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(st.st_mtime)
+    )
+    if response is not None:
+        return set_headers(response)
+
+    if settings.MEDIA_SENDFILE:
+        response = HttpResponse(content_type=content_type)
+        return set_headers(_offload(response, path, full_path))
+
+    byte_range = None
+    header = request.META.get('HTTP_RANGE')
+    if header and _if_range_matches(request, etag, st.st_mtime):
+        try:
+            byte_range = parse_range(header, st.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{st.st_size}'
+            return set_headers(response)
+
+    fp = open(full_path, 'rb')
+    if byte_range is None:
+        # O servidor WSGI pode usar sendfile() com o FileResponse
+        response = FileResponse(fp, content_type=content_type)
+        response['Content-Length'] = st.st_size
+        return set_headers(response)
+
+    start, end = byte_range
+    length = end - start + 1
+    response = StreamingHttpResponse(
+        _read_range(fp, start, length), status=206,
+        content_type=content_type
+    )
+    response['Content-Length'] = length
+    response['Content-Range'] = f'bytes {start}-{end}/{st.st_size}'
+    return set_headers(response)
@@ -0,0 +1,90 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+
+from core import images
+from core.storage import image_storage
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """ManyRelatedField que valida todos os ids numa unica query"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        child = self.child_relation
+        queryset = child.get_queryset()
+        pk_field = queryset.model._meta.pk
+        pks = []
+        for item in data:
+            if child.pk_field is not None:
+                item = child.pk_field.to_internal_value(item)
+            try:
+                pks.append(pk_field.to_python(item))
+            except (DjangoValidationError, TypeError, ValueError):
+                child.fail('incorrect_type', data_type=type(item).__name__)
+
+        objects = queryset.in_bulk(pks)
+        for pk in pks:
+            if pk not in objects:
+                child.fail('does_not_exist', pk_value=pk)
+        return [objects[pk] for pk in pks]
+
+
+class UserPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField limitado aos objetos do usuario autenticado
+
+    Com many=True usa o BulkManyRelatedField."""
+
+    def get_queryset(self):
+        return super().get_queryset() \
+            .filter(user=self.context['request'].user)
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+
+class ImageVariantsField(serializers.Field):
+    """URLs das variantes geradas da imagem, {variante: url}"""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        urls = {}
+        for variant, name in value.items():
+            url = image_storage.url(name)
+            urls[variant] = request.build_absolute_uri(url) \
+                if request is not None else url
+        return urls
+
+
+class HeaderImageField(serializers.ImageField):
+    """ImageField que valida so o cabecalho da imagem (core.images)
+
+    O ImageField do DRF abre e verifica a imagem inteira com o Pillow;
+    aqui nenhum pixel e decodificado e o numero de pixels e limitado."""
+
+    def to_internal_value(self, data):
+        file_object = super(serializers.ImageField, self) \
+            .to_internal_value(data)
+        try:
+            images.check_image(file_object)
+        except images.InvalidImage:
+            self.fail('invalid_image')
+        except images.ImageTooLarge as exc:
+            raise serializers.ValidationError(str(exc), code='too_large')
+        finally:
+            if hasattr(file_object, 'seek'):
+                file_object.seek(0)
+        return file_object
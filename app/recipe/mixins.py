@@ -0,0 +1,75 @@
+import hashlib
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, \
+    patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from core.cache import data_version
+
+
+def make_etag(request, *parts):
+    """ETag forte para a representacao identificada por `parts`, que
+    tambem varia com o formato pedido pelo cliente"""
+    parts += (request.META.get('HTTP_ACCEPT', ''),)
+    raw = ':'.join(str(part) for part in parts)
+    return quote_etag(hashlib.sha1(raw.encode()).hexdigest())
+
+
+class ConditionalGetMixin:
+    """Responde GETs condicionais (If-None-Match / If-Modified-Since)"""
+
+    def get_not_modified(self, request, etag, last_modified=None):
+        """Retorna um 304 se o cliente ja tem a versao atual"""
+        return get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+
+    def set_conditional_headers(self, response, etag, last_modified=None):
+        """Adiciona os validadores a resposta"""
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Accept', 'Authorization'))
+        return response
+
+
+class CachedListMixin(ConditionalGetMixin):
+    """Guarda em cache o resultado do list por usuario
+
+    A chave inclui a versao dos dados do usuario, que muda a cada
+    escrita (ver core.signals), entao nada precisa ser apagado. A mesma
+    chave serve de ETag, e um 304 nao precisa nem consultar o banco."""
+    list_cache_timeout = 300
+
+    def get_list_cache_key(self, request):
+        """Chave por usuario, versao, url e parametros da query"""
+        params = urlencode(sorted(request.query_params.lists()), doseq=True)
+        url = f'{request.build_absolute_uri(request.path)}?{params}'
+        digest = hashlib.sha1(url.encode()).hexdigest()
+        user_id = request.user.pk
+        return f'list:{user_id}:{data_version(user_id)}:{digest}'
+
+    def cached_response(self, request, get_data):
+        """Responde com os dados em cache, chamando `get_data` so quando
+        a chave da requisicao ainda nao esta no cache"""
+        key = self.get_list_cache_key(request)
+        etag = make_etag(request, key)
+        not_modified = self.get_not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+
+        data = cache.get(key)
+        if data is None:
+            data = get_data()
+            cache.set(key, data, self.list_cache_timeout)
+        return self.set_conditional_headers(Response(data), etag)
+
+    def list(self, request, *args, **kwargs):
+        parent = super()
+        return self.cached_response(
+            request, lambda: parent.list(request, *args, **kwargs).data
+        )
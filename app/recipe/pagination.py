@@ -0,0 +1,164 @@
+import json
+
+from django.db.models import Q
+
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import CursorPagination, \
+    _reverse_ordering
+
+
+class BaseRecipeAttrPagination(CursorPagination):
+    """Paginacao por cursor das tags e ingredientes do usuario"""
+    ordering = ('-name', 'id')
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class KeysetCursorPagination(CursorPagination):
+    """Cursor pela chave inteira da ordenacao, como (price, id)
+
+    O CursorPagination do DRF guarda so o primeiro campo e, dentro de um
+    empate, pula as linhas ja vistas com OFFSET, que cresce a cada
+    pagina. Aqui a posicao guarda todos os campos e a proxima pagina
+    filtra por (a < x) OR (a = x AND b < y), que o indice (a, b) atende
+    sem OFFSET, ja que o ultimo campo e unico."""
+
+    def _get_position_from_instance(self, instance, ordering):
+        if len(ordering) == 1:
+            return super()._get_position_from_instance(instance, ordering)
+        return json.dumps([
+            super(KeysetCursorPagination, self)
+            ._get_position_from_instance(instance, (field,))
+            for field in ordering
+        ], separators=(',', ':'))
+
+    def _filter_after(self, queryset, ordering, position, reverse):
+        """Linhas depois de `position` no sentido da paginacao"""
+        if len(ordering) == 1:
+            values = [position]
+        else:
+            try:
+                values = json.loads(position)
+            except ValueError:
+                values = None
+            if not isinstance(values, list) or len(values) != len(ordering):
+                raise NotFound(self.invalid_cursor_message)
+
+        after = Q()
+        equal = {}
+        for field, value in zip(ordering, values):
+            attr = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') != reverse else 'gt'
+            after |= Q(**equal, **{f'{attr}__{lookup}': value})
+            equal[attr] = value
+        # O limite no primeiro campo deixa o planner percorrer o indice so
+        # a partir da posicao
+        first = ordering[0].lstrip('-')
+        lookup = 'lte' if ordering[0].startswith('-') != reverse else 'gte'
+        return queryset.filter(Q(**{f'{first}__{lookup}': values[0]}), after)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """O paginate_queryset do DRF, filtrando pela chave inteira"""
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            queryset = self._filter_after(
+                queryset, self.ordering, current_position, reverse
+            )
+
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(
+                results[-1], self.ordering
+            )
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or \
+                (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and \
+                self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+
+class RecipePagination(KeysetCursorPagination):
+    """Paginacao por cursor das receitas do usuario
+
+    Resultados de busca (anotados com rank) vem do mais relevante para o
+    menos relevante. Fora da busca, ?ordering= aceita os campos de
+    ordering_fields, cobertos pelos indices (user_id, campo, id) que o
+    cursor (campo, id) percorre."""
+    ordering = ('-id',)
+    search_ordering = ('-rank', '-id')
+    ordering_param = 'ordering'
+    ordering_fields = ('id', 'price', 'time_minutes')
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def get_ordering(self, request, queryset, view):
+        if 'rank' in queryset.query.annotations:
+            return self.search_ordering
+
+        ordering = request.query_params.get(self.ordering_param)
+        if not ordering:
+            return super().get_ordering(request, queryset, view)
+        field = ordering.lstrip('-')
+        if field not in self.ordering_fields or \
+                len(ordering) - len(field) > 1:
+            raise ValidationError({self.ordering_param: (
+                f'Use one of: {", ".join(self.ordering_fields)}, '
+                f'optionally prefixed with "-"'
+            )})
+        if field == 'id':
+            return (ordering,)
+        # O id desempata no mesmo sentido, para o cursor (campo, id)
+        # percorrer o indice nos dois sentidos
+        return (ordering, f'{ordering[:-len(field)]}id')
+
+
+class CookablePagination(RecipePagination):
+    """Paginacao das receitas que o usuario pode cozinhar, das que
+    faltam menos ingredientes para as que faltam mais"""
+    ordering = ('missing', '-recipe_id')
+
+    def get_ordering(self, request, queryset, view):
+        return self.ordering
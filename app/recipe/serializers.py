@@ -1,33 +1,120 @@
+from collections import OrderedDict
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import CharField, Value
 from rest_framework import serializers
+from rest_framework.settings import api_settings
+from rest_framework.validators import UniqueTogetherValidator
+
+from core.cache import bump_data_version
+from core.models import Tag, Ingredient, Recipe, UserNameManager
+from core.renderers import dumps, stream_list
+from recipe.fields import HeaderImageField, ImageVariantsField, \
+    UserPrimaryKeyRelatedField
+
+
+class UserNameSerializer(serializers.ModelSerializer):
+    """Base dos objetos identificados por (usuario, nome)"""
+    user = serializers.HiddenField(default=serializers.CurrentUserDefault())
 
-from core.models import Tag, Ingredient, Recipe
+    def validate_name(self, value):
+        """Normaliza o nome como no upsert em lote"""
+        return UserNameManager.normalize_name(value)
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(UserNameSerializer):
     """Serializa objetos TAG"""
 
     class Meta:
         model = Tag
-        fields = ('id', 'name')
+        fields = ('id', 'name', 'user')
         read_only_fields = ('id',)
+        validators = [UniqueTogetherValidator(
+            queryset=Tag.objects.all(), fields=('user', 'name')
+        )]
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(UserNameSerializer):
     """Serializa objetos Ingredient"""
 
     class Meta:
         model = Ingredient
-        fields = ('id', 'name')
+        fields = ('id', 'name', 'user')
         read_only_fields = ('id',)
+        validators = [UniqueTogetherValidator(
+            queryset=Ingredient.objects.all(), fields=('user', 'name')
+        )]
+
+
+class NameListSerializer(serializers.Serializer):
+    """Nomes enviados para o upsert em lote de tags e ingredientes"""
+    names = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        allow_empty=False,
+        max_length=1000
+    )
+
+
+class LimitSerializer(serializers.Serializer):
+    """Parametro com o numero maximo de resultados"""
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=10)
+
+
+class ImageWidthSerializer(serializers.Serializer):
+    """Largura pedida no redimensionamento sob demanda"""
+    width = serializers.ChoiceField(choices=settings.RECIPE_IMAGE_WIDTHS)
+
+
+class AutocompleteSerializer(LimitSerializer):
+    """Parametros do autocomplete de tags e ingredientes"""
+    prefix = serializers.CharField(max_length=255, trim_whitespace=False)
+
+    def validate_prefix(self, value):
+        """Normaliza como os nomes salvos, sem remover o espaco final"""
+        name = UserNameManager.normalize_name(value)
+        if name and value[-1].isspace():
+            name += ' '
+        return name
+
+
+class RecipeRangeSerializer(serializers.Serializer):
+    """Filtros por faixa de preco e tempo de preparo"""
+    price_min = serializers.DecimalField(max_digits=5, decimal_places=2,
+                                         required=False)
+    price_max = serializers.DecimalField(max_digits=5, decimal_places=2,
+                                         required=False)
+    time_max = serializers.IntegerField(min_value=0, required=False)
+
+
+class CookableSerializer(serializers.Serializer):
+    """Parametros da busca de receitas pelos ingredientes disponiveis"""
+    pantry = serializers.CharField()
+    missing = serializers.IntegerField(min_value=0, max_value=10, default=0)
+
+    def validate_pantry(self, value):
+        """Converte a lista de ids separados por virgula"""
+        try:
+            ids = {int(pk) for pk in value.split(',')}
+        except ValueError:
+            raise serializers.ValidationError(
+                'Use a comma separated list of ingredient ids.'
+            )
+        if len(ids) > 1000:
+            raise serializers.ValidationError(
+                'Ensure this field has no more than 1000 ids.'
+            )
+        return ids
 
 
 class RecipeSerializer(serializers.ModelSerializer):
     """Serializa uma receita"""
-    ingredients = serializers.PrimaryKeyRelatedField(
+    ingredients = UserPrimaryKeyRelatedField(
         many=True,
         queryset=Ingredient.objects.all()
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = UserPrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all()
     )
@@ -38,17 +125,237 @@ class RecipeSerializer(serializers.ModelSerializer):
                   'time_minutes', 'price', 'link')
         read_only_fields = ('id',)
 
+    def update(self, instance, validated_data):
+        """Aplica so a diferenca nos vinculos m2m, em vez do set()"""
+        relations = {
+            name: validated_data.pop(name)
+            for name in ('ingredients', 'tags') if name in validated_data
+        }
+        instance = super().update(instance, validated_data)
+        for name, objs in relations.items():
+            manager = getattr(instance, name)
+            # O get_object da view ja trouxe os vinculos com prefetch
+            current = {obj.pk for obj in manager.all()}
+            wanted = {obj.pk for obj in objs}
+            if current - wanted:
+                manager.remove(*(current - wanted))
+            if wanted - current:
+                manager.add(*(wanted - current))
+        return instance
+
+
+class RecipeValuesSerializer:
+    """Caminho rapido de leitura do RecipeSerializer
+
+    Recebe linhas de values() e busca os ids das relacoes de todas as
+    receitas de uma vez, gerando a mesma saida do RecipeSerializer sem
+    instanciar models nem um serializer por receita."""
+    relation_fields = ('ingredients', 'tags')
+    value_fields = ('id', 'title', 'time_minutes', 'price', 'link')
+
+    def __init__(self, instance, context=None):
+        self.instance = instance
+        self.context = context or {}
+
+    @staticmethod
+    def _relation_map(relation, recipe_ids):
+        """Mapeia id da receita -> ids relacionados, ordenados por id"""
+        field = Recipe._meta.get_field(relation)
+        target = f'{field.m2m_reverse_field_name()}_id'
+        links = field.remote_field.through.objects \
+            .filter(recipe_id__in=recipe_ids) \
+            .order_by(target) \
+            .values_list('recipe_id', target)
+        ids = {}
+        for recipe_id, target_id in links:
+            ids.setdefault(recipe_id, []).append(target_id)
+        return ids
+
+    def to_representation(self, rows):
+        """Serializa uma lista de linhas de values()"""
+        recipe_ids = [row['id'] for row in rows]
+        relations = {
+            name: self._relation_map(name, recipe_ids) if rows else {}
+            for name in self.relation_fields
+        }
+        fields = RecipeSerializer(context=self.context).fields
+        names = RecipeSerializer.Meta.fields
+
+        data = []
+        for row in rows:
+            item = OrderedDict()
+            for name in names:
+                if name in relations:
+                    item[name] = relations[name].get(row['id'], [])
+                elif row[name] is None:
+                    item[name] = None
+                else:
+                    item[name] = fields[name].to_representation(row[name])
+            data.append(item)
+        return data
+
+    @property
+    def data(self):
+        return self.to_representation(list(self.instance))
+
 
 class RecipeDetailSerializer(RecipeSerializer):
     """Serializa o detalhe da receita"""
     ingredients = IngredientSerializer(many=True, read_only=True)
     tags = TagSerializer(many=True, read_only=True)
+    image_variants = ImageVariantsField()
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ('image_variants',)
+
+
+class RecipeExportSerializer(RecipeValuesSerializer):
+    """Exporta receitas com tags e ingredientes embutidos, no mesmo
+    formato do RecipeDetailSerializer, em NDJSON ou num array JSON"""
+
+    @staticmethod
+    def _relation_map(relation, recipe_ids):
+        """Mapeia id da receita -> {id, name} relacionados"""
+        field = Recipe._meta.get_field(relation)
+        target = field.m2m_reverse_field_name()
+        links = field.remote_field.through.objects \
+            .filter(recipe_id__in=recipe_ids) \
+            .order_by(f'{target}_id') \
+            .values_list('recipe_id', f'{target}_id', f'{target}__name')
+        items = {}
+        for recipe_id, target_id, name in links:
+            items.setdefault(recipe_id, []).append(
+                OrderedDict((('id', target_id), ('name', name)))
+            )
+        return items
+
+    def iter_chunks(self, chunk_size=2000):
+        """Gera listas de receitas ja serializadas, lendo as receitas com
+        um cursor no servidor e as relacoes em lotes de `chunk_size`"""
+        rows = self.instance.iterator(chunk_size=chunk_size)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return
+            yield self.to_representation(chunk)
+
+    def iter_ndjson(self, chunk_size=2000):
+        """Gera uma linha JSON por receita"""
+        for items in self.iter_chunks(chunk_size):
+            yield b''.join(dumps(item) + b'\n' for item in items)
+
+    def iter_json(self, chunk_size=2000):
+        """Gera um unico array JSON com todas as receitas"""
+        items = (item for chunk in self.iter_chunks(chunk_size)
+                 for item in chunk)
+        return stream_list(items, chunk_size)
+
+
+class RecipeBulkListSerializer(serializers.ListSerializer):
+    """Cria varias receitas numa unica transacao"""
+    relations = (('tags', Tag), ('ingredients', Ingredient))
+
+    def to_internal_value(self, data):
+        # Antes de validar os itens: o lote inteiro vai numa transacao e
+        # a posse dos vinculos numa query so
+        if isinstance(data, list) and len(data) > settings.RECIPE_BULK_MAX:
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [
+                    f'Ensure this list has no more than '
+                    f'{settings.RECIPE_BULK_MAX} items.'
+                ]
+            }, code='max_length')
+        items = super().to_internal_value(data)
+        user = self.context['request'].user
+
+        # Confere a posse de todas as tags e ingredientes numa query so
+        owned = None
+        for relation, model in self.relations:
+            ids = {pk for item in items for pk in item[relation]}
+            query = model.objects.filter(user=user, id__in=ids) \
+                .annotate(relation=Value(relation, CharField())) \
+                .values_list('relation', 'id')
+            owned = query if owned is None else owned.union(query, all=True)
+        owned = set(owned)
+
+        errors = []
+        for item in items:
+            error = {}
+            for relation, _ in self.relations:
+                invalid = [pk for pk in item[relation]
+                           if (relation, pk) not in owned]
+                if invalid:
+                    error[relation] = [
+                        f'Invalid pk "{pk}" - object does not exist.'
+                        for pk in invalid
+                    ]
+            errors.append(error)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return items
+
+    def create(self, validated_data):
+        with transaction.atomic():
+            recipes = Recipe.objects.bulk_create([
+                Recipe(**{name: value for name, value in item.items()
+                          if name not in dict(self.relations)})
+                for item in validated_data
+            ])
+            for relation, _ in self.relations:
+                field = Recipe._meta.get_field(relation)
+                through = field.remote_field.through
+                target = f'{field.m2m_reverse_field_name()}_id'
+                through.objects.bulk_create([
+                    through(recipe_id=recipe.id, **{target: pk})
+                    for recipe, item in zip(recipes, validated_data)
+                    for pk in dict.fromkeys(item[relation])
+                ])
+            created = Recipe.objects.filter(
+                pk__in=[recipe.pk for recipe in recipes]
+            )
+            created.update_link_fields()
+        # bulk_create nao dispara os signals de invalidacao
+        for user_id in {recipe.user_id for recipe in recipes}:
+            bump_data_version(user_id)
+        return recipes
+
+    def to_representation(self, data):
+        rows = [
+            {name: getattr(recipe, name)
+             for name in RecipeValuesSerializer.value_fields}
+            for recipe in data
+        ]
+        return RecipeValuesSerializer(rows, context=self.context).data
+
+
+class RecipeBulkSerializer(serializers.ModelSerializer):
+    """Valida um item da criacao de receitas em lote"""
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(), default=list
+    )
+    tags = serializers.ListField(
+        child=serializers.IntegerField(), default=list
+    )
+
+    class Meta:
+        model = Recipe
+        fields = RecipeSerializer.Meta.fields
+        read_only_fields = ('id',)
+        list_serializer_class = RecipeBulkListSerializer
 
 
 class RecipeImageSerializer(serializers.ModelSerializer):
     """Serializer para carregar iagem"""
+    image = HeaderImageField(allow_null=True, required=False)
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'image')
+        fields = ('id', 'image', 'image_variants')
         read_only_fields = ('id',)
+
+    def update(self, instance, validated_data):
+        """As variantes da imagem anterior deixam de valer; as novas sao
+        geradas em segundo plano (core.images)"""
+        validated_data['image_variants'] = {}
+        return super().update(instance, validated_data)
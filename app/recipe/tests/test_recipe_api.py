@@ -1,20 +1,42 @@
+import hashlib
+import io
+import json
+import shutil
 import tempfile
 import os
+from datetime import datetime
+from decimal import Decimal
+from unittest.mock import patch
 
 from PIL import Image
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import Prefetch
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.timezone import utc
 
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 
+from core import images
+from core.disk_cache import DiskLRUCache
 from core.models import Recipe, Tag, Ingredient
+from core.tests.utils import capture_on_commit_callbacks
 
-from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
+from recipe.pagination import CookablePagination, RecipePagination
+from recipe.views import RecipeViewSet
+from recipe.serializers import RecipeSerializer, RecipeDetailSerializer, \
+    RecipeValuesSerializer
 
 RECIPE_URL = reverse('recipe:recipe-list')
+COOKABLE_URL = reverse('recipe:recipe-cookable')
+EXPORT_URL = reverse('recipe:recipe-export')
 
 
 def image_upload_url(recipe_id):
@@ -22,6 +44,17 @@ def image_upload_url(recipe_id):
     return reverse('recipe:recipe-upload-image', args=[recipe_id])
 
 
+def similar_url(recipe_id):
+    """Retorna a URL das receitas parecidas"""
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
+def resized_image_url(recipe_id, width):
+    """Retorna a URL da imagem redimensionada da receita"""
+    url = reverse('recipe:recipe-resized-image', args=[recipe_id])
+    return f'{url}?width={width}'
+
+
 def detail_url(recipe_id):
     """Retorna a url de detalhe da receita"""
     return reverse('recipe:recipe-detail', args=[recipe_id])
@@ -82,7 +115,7 @@ class PrivateRecipeApiTests(TestCase):
         recipes = Recipe.objects.all().order_by('-id')
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_recipes_limited_to_user(self):
         """Testando que apenas o usuario pode ver a suas receitas"""
@@ -97,8 +130,223 @@ class PrivateRecipeApiTests(TestCase):
         recipes = Recipe.objects.filter(user=self.user)
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'], serializer.data)
+
+    @patch.object(RecipePagination, 'page_size', 2)
+    def test_retrieve_recipes_paginated(self):
+        """Testa que as receitas sao paginadas por cursor"""
+        recipes = [sample_recipe(user=self.user) for _ in range(5)]
+
+        res = self.client.get(RECIPE_URL)
+        self.assertEqual(len(res.data['results']), 2)
+        ids = [recipe['id'] for recipe in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            ids += [recipe['id'] for recipe in res.data['results']]
+
+        self.assertEqual(ids, [recipe.id for recipe in reversed(recipes)])
+
+    def test_list_recipes_constant_queries(self):
+        """Testa que a lista de receitas nao cresce em queries (N+1)"""
+        for i in range(5):
+            recipe = sample_recipe(user=self.user, title=f'Receita {i}')
+            recipe.tags.add(sample_tag(user=self.user, name=f'Tag {i}'))
+            recipe.ingredients.add(
+                sample_ingredient(user=self.user, name=f'Ingr {i}')
+            )
+
+        # receitas + tags + ingredientes
+        with self.assertNumQueries(3):
+            res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 5)
+
+    def test_values_serializer_matches_serializer(self):
+        """Testa que o caminho rapido gera o mesmo JSON do serializer"""
+        tags = [sample_tag(user=self.user, name=f'Tag {i}') for i in range(3)]
+        ingredients = [sample_ingredient(user=self.user, name=f'Ingr {i}')
+                       for i in range(3)]
+        sample_recipe(user=self.user, title='Sem vinculos', link='')
+        recipe = sample_recipe(user=self.user, title='Bolo', price='12.3',
+                               link='http://example.com/bolo')
+        recipe.tags.add(tags[2], tags[0])
+        recipe.ingredients.add(*ingredients)
+        recipe = sample_recipe(user=self.user, title='Pão', price=7)
+        recipe.tags.add(tags[1])
+
+        recipes = Recipe.objects.order_by('-id')
+        expected = RecipeSerializer(
+            recipes.prefetch_related(
+                Prefetch('tags', Tag.objects.order_by('id')),
+                Prefetch('ingredients', Ingredient.objects.order_by('id')),
+            ),
+            many=True
+        ).data
+        fast = RecipeValuesSerializer(
+            recipes.values(*RecipeValuesSerializer.value_fields)
+        ).data
+
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(fast), renderer.render(expected))
+
+    @patch.object(RecipeViewSet, 'export_chunk_size', 2)
+    def test_export_recipes_ndjson(self):
+        """Testa a exportacao em NDJSON com relacoes em lotes"""
+        tag = sample_tag(user=self.user)
+        ingredient = sample_ingredient(user=self.user)
+        for i in range(5):
+            recipe = sample_recipe(user=self.user, title=f'Receita {i}')
+            recipe.tags.add(tag)
+            recipe.ingredients.add(ingredient)
+        sample_recipe(user=get_user_model().objects.create_user(
+            'outro@gmail.com', 'testpass'
+        ))
+
+        res = self.client.get(EXPORT_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        # cursor das receitas + 3 lotes x (tags + ingredientes)
+        with self.assertNumQueries(7):
+            body = b''.join(res.streaming_content)
+
+        lines = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(lines[0]['title'], 'Receita 0')
+        self.assertEqual(lines[0]['tags'], [{'id': tag.id, 'name': tag.name}])
+        self.assertEqual(
+            lines[-1]['ingredients'],
+            [{'id': ingredient.id, 'name': ingredient.name}]
+        )
+
+    @patch.object(RecipeViewSet, 'export_chunk_size', 2)
+    def test_export_recipes_json_array(self):
+        """Testa a exportacao como um array JSON gerado em pedacos"""
+        for i in range(5):
+            sample_recipe(user=self.user, title=f'Receita {i}')
+
+        res = self.client.get(EXPORT_URL, HTTP_ACCEPT='application/json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/json')
+        chunks = list(res.streaming_content)
+        self.assertGreater(len(chunks), 2)
+        data = json.loads(b''.join(chunks))
+        self.assertEqual([item['title'] for item in data],
+                         [f'Receita {i}' for i in range(5)])
+
+    def test_list_recipes_cached(self):
+        """Testa que a lista repetida vem do cache sem queries"""
+        sample_recipe(user=self.user)
+        self.client.get(RECIPE_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_list_recipes_cache_invalidated(self):
+        """Testa que escritas invalidam a lista em cache"""
+        recipe = sample_recipe(user=self.user)
+        self.client.get(RECIPE_URL)
+
+        with capture_on_commit_callbacks(execute=True):
+            tag = sample_tag(user=self.user)
+            recipe.tags.add(tag)
+        res = self.client.get(RECIPE_URL)
+        self.assertEqual(res.data['results'][0]['tags'], [tag.id])
+
+        with capture_on_commit_callbacks(execute=True):
+            recipe.tags.remove(tag)
+        res = self.client.get(RECIPE_URL)
+        self.assertEqual(res.data['results'][0]['tags'], [])
+
+        with capture_on_commit_callbacks(execute=True):
+            self.client.delete(detail_url(recipe.id))
+        res = self.client.get(RECIPE_URL)
+        self.assertEqual(res.data['results'], [])
+
+    def test_view_recipe_detail_constant_queries(self):
+        """Testa que o detalhe da receita usa um numero fixo de queries"""
+        recipe = sample_recipe(user=self.user)
+        for i in range(3):
+            recipe.tags.add(sample_tag(user=self.user, name=f'Tag {i}'))
+            recipe.ingredients.add(
+                sample_ingredient(user=self.user, name=f'Ingr {i}')
+            )
+
+        # updated_at (GET condicional) + receita + tags + ingredientes
+        with self.assertNumQueries(4):
+            res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['tags']), 3)
+        self.assertEqual(len(res.data['ingredients']), 3)
+
+    def test_view_recipe_detail_not_modified(self):
+        """Testa que o detalhe inalterado retorna 304 sem serializar"""
+        recipe = sample_recipe(user=self.user)
+        res = self.client.get(detail_url(recipe.id))
+        self.assertIn('Last-Modified', res)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(
+                detail_url(recipe.id), HTTP_IF_NONE_MATCH=res['ETag']
+            )
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_view_recipe_detail_not_modified_since(self):
+        """Testa o 304 pelo If-Modified-Since, com updated_at em
+        microssegundos"""
+        recipe = sample_recipe(user=self.user)
+        Recipe.objects.filter(pk=recipe.pk).update(
+            updated_at=datetime(2020, 1, 1, 12, 0, 0, 500000, tzinfo=utc)
+        )
+        last_modified = self.client.get(detail_url(recipe.id))['Last-Modified']
+
+        res = self.client.get(detail_url(recipe.id),
+                              HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Recipe.objects.filter(pk=recipe.pk).update(
+            updated_at=datetime(2020, 1, 1, 12, 0, 1, tzinfo=utc)
+        )
+        res = self.client.get(detail_url(recipe.id),
+                              HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_view_recipe_detail_modified_by_links(self):
+        """Testa que mudar tags da receita muda seu ETag"""
+        recipe = sample_recipe(user=self.user)
+        tag = sample_tag(user=self.user)
+        etag = self.client.get(detail_url(recipe.id))['ETag']
+
+        recipe.tags.add(tag)
+        res = self.client.get(detail_url(recipe.id), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        etag = res['ETag']
+        tag.name = 'Renamed'
+        tag.save()
+        res = self.client.get(detail_url(recipe.id), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['tags'][0]['name'], 'Renamed')
+
+    def test_list_recipes_not_modified(self):
+        """Testa que a lista inalterada retorna 304 sem queries"""
+        recipe = sample_recipe(user=self.user)
+        etag = self.client.get(RECIPE_URL)['ETag']
+
+        with self.assertNumQueries(0):
+            res = self.client.get(RECIPE_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with capture_on_commit_callbacks(execute=True):
+            recipe.title = 'Outro titulo'
+            recipe.save()
+        res = self.client.get(RECIPE_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
 
     def test_view_recipe_detail(self):
         """Testa a visualização de detalhes de uma receita"""
@@ -166,6 +414,60 @@ class PrivateRecipeApiTests(TestCase):
         self.assertIn(ingredient1, ingredients)
         self.assertIn(ingredient2, ingredients)
 
+    def test_bulk_create_recipes(self):
+        """Testa a criacao de varias receitas numa requisicao"""
+        tag = sample_tag(user=self.user)
+        ingredient = sample_ingredient(user=self.user)
+        payload = [
+            {'title': 'Sopa', 'time_minutes': 20, 'price': '4.00',
+             'tags': [tag.id], 'ingredients': [ingredient.id]},
+            {'title': 'Torrada', 'time_minutes': 5, 'price': '1.50'},
+        ]
+
+        res = self.client.post(RECIPE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([item['title'] for item in res.data],
+                         ['Sopa', 'Torrada'])
+        self.assertEqual(res.data[0]['tags'], [tag.id])
+        self.assertEqual(res.data[1]['ingredients'], [])
+        recipe = Recipe.objects.get(id=res.data[0]['id'])
+        self.assertEqual(recipe.user, self.user)
+        self.assertIn(ingredient, recipe.ingredients.all())
+
+    @override_settings(RECIPE_BULK_MAX=2)
+    def test_bulk_create_max_items(self):
+        """Testa que listas acima do limite sao recusadas"""
+        payload = [{'title': f'Receita {i}', 'time_minutes': 5,
+                    'price': '1.00'} for i in range(3)]
+
+        res = self.client.post(RECIPE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('non_field_errors', res.data)
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+
+    def test_bulk_create_checks_ownership(self):
+        """Testa que tags de outro usuario invalidam o lote inteiro"""
+        user2 = get_user_model().objects.create_user(
+            'teste2@gmail.com', 'testpass2'
+        )
+        tag = sample_tag(user=self.user)
+        other_tag = sample_tag(user=user2)
+        payload = [
+            {'title': 'Sopa', 'time_minutes': 20, 'price': '4.00',
+             'tags': [tag.id]},
+            {'title': 'Torrada', 'time_minutes': 5, 'price': '1.50',
+             'tags': [other_tag.id]},
+        ]
+
+        res = self.client.post(RECIPE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('tags', res.data[1])
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+
     def test_partial_update_recipe(self):
         """Testa atualizacao de receita via patch"""
         recipe = sample_recipe(user=self.user)
@@ -185,6 +487,47 @@ class PrivateRecipeApiTests(TestCase):
         self.assertEqual(len(tags), 1)
         self.assertIn(new_tag, tags)
 
+    def test_update_recipe_tags_constant_queries(self):
+        """Testa que atualizar as tags nao faz uma query por tag"""
+        recipe = sample_recipe(user=self.user)
+        tags = [sample_tag(user=self.user, name=f'Tag {i}')
+                for i in range(20)]
+        recipe.tags.add(*tags[:10])
+        url = detail_url(recipe.id)
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.patch(
+                url, {'tags': [tag.id for tag in tags[5:15]]}, format='json'
+            )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        with CaptureQueriesContext(connection) as ctx2:
+            self.client.patch(
+                url, {'tags': [tag.id for tag in tags[:5] + tags[15:]]},
+                format='json'
+            )
+
+        self.assertEqual(len(ctx2), len(ctx))
+        self.assertEqual(
+            sorted(recipe.tags.values_list('id', flat=True)),
+            sorted(tag.id for tag in tags[:5] + tags[15:])
+        )
+
+    def test_update_recipe_tags_of_other_user(self):
+        """Testa que nao eh possivel vincular tags de outro usuario"""
+        user2 = get_user_model().objects.create_user(
+            'teste2@gmail.com', 'testpass2'
+        )
+        recipe = sample_recipe(user=self.user)
+        other_tag = sample_tag(user=user2)
+
+        res = self.client.patch(
+            detail_url(recipe.id), {'tags': [other_tag.id]}, format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags', res.data)
+        self.assertFalse(recipe.tags.exists())
+
     def test_full_update_recipe(self):
         """Testa a atualiza de uma receita via PUT"""
         recipe = sample_recipe(user=self.user)
@@ -233,12 +576,129 @@ class RecipeImageUploadTests(TestCase):
         self.assertIn('image', res.data)
         self.assertTrue(os.path.exists(self.recipe.image.path))
 
+    def test_upload_same_image_shares_file(self):
+        """Testa que a mesma foto em duas receitas usa um unico arquivo"""
+        other = sample_recipe(user=self.user, title='Outra')
+        data = io.BytesIO()
+        Image.new('RGB', (10, 10)).save(data, format='JPEG')
+        for recipe in (self.recipe, other):
+            upload = SimpleUploadedFile('foto.jpg', data.getvalue(),
+                                        content_type='image/jpeg')
+            res = self.client.post(image_upload_url(recipe.id),
+                                   {'image': upload}, format='multipart')
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self.recipe.refresh_from_db()
+        other.refresh_from_db()
+        digest = hashlib.sha256(data.getvalue()).hexdigest()
+        self.assertEqual(self.recipe.image.name, other.image.name)
+        self.assertEqual(os.path.basename(other.image.name), f'{digest}.jpg')
+
+    @patch('recipe.views.images.enqueue_variants')
+    def test_upload_image_enqueues_variants(self, enqueue_variants):
+        """Testa que o upload agenda as variantes e descarta as antigas"""
+        Recipe.objects.filter(pk=self.recipe.pk) \
+            .update(image_variants={'thumb': 'uploads/recipe/old.webp'})
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            Image.new('RGB', (10, 10)).save(ntf, format='JPEG')
+            ntf.seek(0)
+            res = self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(res.data['image_variants'], {})
+        self.assertEqual(self.recipe.image_variants, {})
+        enqueue_variants.assert_called_once_with(self.recipe)
+
+    @patch('recipe.views.images.enqueue_variants')
+    def test_clear_image_skips_variants(self, enqueue_variants):
+        """Testa que limpar a imagem nao agenda variantes"""
+        res = self.client.post(image_upload_url(self.recipe.id),
+                               {'image': None}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNone(res.data['image'])
+        enqueue_variants.assert_not_called()
+
+    def test_resized_image_cached_on_disk(self):
+        """Testa o redimensionamento sob demanda com cache em disco"""
+        self.recipe.image.save('bolo.png', ContentFile(b''), save=False)
+        with self.recipe.image.open('wb') as fp:
+            Image.new('RGB', (1000, 500)).save(fp, format='PNG')
+        self.recipe.save()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        url = resized_image_url(self.recipe.id, 320)
+
+        with patch.object(images, 'resized_cache',
+                          DiskLRUCache(directory, 10 ** 6)):
+            res = self.client.get(url, HTTP_ACCEPT='image/webp')
+            with patch.object(images, 'render_width') as render_width:
+                res2 = self.client.get(url)
+                res3 = self.client.get(url, HTTP_IF_NONE_MATCH=res['ETag'])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'image/webp')
+        with Image.open(io.BytesIO(res.content)) as img:
+            self.assertEqual(img.size, (320, 160))
+        render_width.assert_not_called()
+        self.assertEqual(b''.join(res2.streaming_content), res.content)
+        self.assertEqual(res3.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_resized_image_invalid(self):
+        """Testa larguras fora da lista e receitas sem imagem"""
+        res = self.client.get(resized_image_url(self.recipe.id, 321))
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.get(resized_image_url(self.recipe.id, 320))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_resized_image_missing_file(self):
+        """Testa que uma imagem sem arquivo no storage da 404"""
+        Recipe.objects.filter(pk=self.recipe.pk) \
+            .update(image='uploads/recipe/missing.png')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        with patch.object(images, 'resized_cache',
+                          DiskLRUCache(directory, 10 ** 6)):
+            res = self.client.get(resized_image_url(self.recipe.id, 320))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_upload_bad_image(self):
         """Testa a carga de uma imagem invalida"""
         url = image_upload_url(self.recipe.id)
         res = self.client.post(url, {'image': 'notimage'}, format='multipart')
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def _post_image(self, content, name='foto.png'):
+        upload = SimpleUploadedFile(name, content, content_type='image/png')
+        return self.client.post(image_upload_url(self.recipe.id),
+                                {'image': upload}, format='multipart')
+
+    @override_settings(RECIPE_IMAGE_MAX_BYTES=1000)
+    def test_upload_image_too_many_bytes(self):
+        """Testa que uploads acima do limite de bytes sao recusados"""
+        res = self._post_image(b'0' * 2000)
+
+        self.assertEqual(res.status_code,
+                         status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+
+    @override_settings(RECIPE_IMAGE_MAX_PIXELS=99)
+    def test_upload_image_too_many_pixels(self):
+        """Testa que imagens com pixels demais sao recusadas, pequenas ou
+        grandes o bastante para a checagem durante o upload"""
+        buf = io.BytesIO()
+        Image.new('RGB', (10, 10)).save(buf, format='PNG')
+        for content in (buf.getvalue(), buf.getvalue() + b'\0' * 70000):
+            res = self._post_image(content)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('pixels', res.data['image'][0])
+
     def test_filter_recipes_by_tags(self):
         """Testa o retorno com tags especificas"""
         recipe1 = sample_recipe(user=self.user, title='Thai vegetable curry')
@@ -258,9 +718,9 @@ class RecipeImageUploadTests(TestCase):
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
 
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
 
     def test_filter_recipes_by_ingredients(self):
         """Testa o retorno com ingredientes especificos"""
@@ -281,6 +741,330 @@ class RecipeImageUploadTests(TestCase):
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
 
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
+
+    def test_filter_recipes_by_tags_distinct(self):
+        """Testa que o filtro por varias tags nao duplica receitas"""
+        recipe = sample_recipe(user=self.user)
+        tag1 = sample_tag(user=self.user, name='Vegan')
+        tag2 = sample_tag(user=self.user, name='Vegetarian')
+        recipe.tags.add(tag1, tag2)
+
+        res = self.client.get(RECIPE_URL, {'tags': f'{tag1.id},{tag2.id}'})
+
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_filter_recipes_match_all(self):
+        """Testa o filtro por receitas que tem todas as tags pedidas"""
+        tag1 = sample_tag(user=self.user, name='Vegan')
+        tag2 = sample_tag(user=self.user, name='Dessert')
+        ingredient = sample_ingredient(user=self.user, name='Lime')
+        recipe1 = sample_recipe(user=self.user, title='Lime sorbet')
+        recipe1.tags.add(tag1, tag2)
+        recipe1.ingredients.add(ingredient)
+        recipe2 = sample_recipe(user=self.user, title='Lime salad')
+        recipe2.tags.add(tag1)
+        recipe2.ingredients.add(ingredient)
+        recipe3 = sample_recipe(user=self.user, title='Vegan cake')
+        recipe3.tags.add(tag1, tag2)
+
+        res = self.client.get(RECIPE_URL, {
+            'tags': f'{tag1.id},{tag2.id}',
+            'ingredients': f'{ingredient.id}',
+            'match': 'all',
+        })
+
+        ids = [recipe['id'] for recipe in res.data['results']]
+        self.assertEqual(ids, [recipe1.id])
+
+    def test_filter_recipes_invalid_match(self):
+        """Testa que um modo de filtro invalido retorna erro"""
+        res = self.client.get(RECIPE_URL, {'tags': '1', 'match': 'some'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_recipes(self):
+        """Testa a busca por titulo, tags e ingredientes"""
+        recipe1 = sample_recipe(user=self.user, title='Thai vegetable curry')
+        recipe2 = sample_recipe(user=self.user, title='Aubergine tahini')
+        recipe2.ingredients.add(sample_ingredient(user=self.user,
+                                                  name='Curry powder'))
+        recipe3 = sample_recipe(user=self.user, title='Fish and chips')
+        recipe3.tags.add(sample_tag(user=self.user, name='Vegan'))
+
+        res = self.client.get(RECIPE_URL, {'search': 'curries'})
+
+        self.assertEqual(
+            [item['id'] for item in res.data['results']],
+            [recipe1.id, recipe2.id]
+        )
+        self.assertNotIn('rank', res.data['results'][0])
+        res = self.client.get(RECIPE_URL, {'search': 'vegan'})
+        self.assertEqual(
+            [item['id'] for item in res.data['results']], [recipe3.id]
+        )
+
+    @patch.object(RecipePagination, 'page_size', 2)
+    def test_search_recipes_paginated(self):
+        """Testa que os resultados da busca sao paginados por rank"""
+        for i in range(5):
+            sample_recipe(user=self.user, title='Soup ' + 'soup ' * i)
+
+        res = self.client.get(RECIPE_URL, {'search': 'soup'})
+        ids = [item['id'] for item in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            ids += [item['id'] for item in res.data['results']]
+
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(ids, sorted(ids, reverse=True))
+
+    def test_search_recipes_paginated_ties(self):
+        """Testa que paginar a busca com ranks iguais ou quase iguais nao
+        repete nem pula receitas"""
+        recipes = [
+            sample_recipe(user=self.user, title=title)
+            for title in ['Soup soup soup'] * 3 + ['Soup soup'] * 2 +
+            ['Soup'] * 3 + ['Soup ' + 'x ' * i for i in range(1, 4)]
+        ]
+
+        for page_size in (1, 2, 3, 4):
+            with patch.object(RecipePagination, 'page_size', page_size):
+                res = self.client.get(RECIPE_URL, {'search': 'soup'})
+                ids = [item['id'] for item in res.data['results']]
+                # Um cursor que repete a pagina nao pode travar o teste
+                for _ in recipes:
+                    if not res.data['next']:
+                        break
+                    res = self.client.get(res.data['next'])
+                    ids += [item['id'] for item in res.data['results']]
+
+            self.assertEqual(len(ids), len(recipes))
+            self.assertEqual(set(ids), {recipe.id for recipe in recipes})
+
+    def test_search_vector_follows_tag_changes(self):
+        """Testa que renomear ou apagar uma tag atualiza a busca"""
+        recipe = sample_recipe(user=self.user)
+        tag = sample_tag(user=self.user, name='Breakfast')
+        recipe.tags.add(tag)
+
+        with capture_on_commit_callbacks(execute=True):
+            tag.name = 'Brunch'
+            tag.save()
+        res = self.client.get(RECIPE_URL, {'search': 'brunch'})
+        self.assertEqual(len(res.data['results']), 1)
+
+        with capture_on_commit_callbacks(execute=True):
+            tag.delete()
+        res = self.client.get(RECIPE_URL, {'search': 'brunch'})
+        self.assertEqual(len(res.data['results']), 0)
+
+    def test_cookable_recipes(self):
+        """Testa as receitas que podem ser feitas com a despensa"""
+        eggs = sample_ingredient(user=self.user, name='Eggs')
+        milk = sample_ingredient(user=self.user, name='Milk')
+        flour = sample_ingredient(user=self.user, name='Flour')
+        omelette = sample_recipe(user=self.user, title='Omelette')
+        omelette.ingredients.add(eggs)
+        pancake = sample_recipe(user=self.user, title='Pancake')
+        pancake.ingredients.add(eggs, milk, flour)
+        bread = sample_recipe(user=self.user, title='Bread')
+        bread.ingredients.add(flour)
+        sample_recipe(user=self.user, title='Water')
+        pantry = f'{eggs.id},{milk.id}'
+
+        res = self.client.get(COOKABLE_URL, {'pantry': pantry})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in res.data['results']],
+                         [omelette.id])
+        self.assertEqual(res.data['results'][0]['missing'], [])
+
+        res = self.client.get(COOKABLE_URL, {'pantry': pantry, 'missing': 1})
+        self.assertEqual([item['id'] for item in res.data['results']],
+                         [omelette.id, pancake.id])
+        self.assertEqual(res.data['results'][1]['missing'], [flour.id])
+
+    def test_cookable_recipes_follow_ingredient_changes(self):
+        """Testa que remover ou apagar ingredientes muda o resultado"""
+        eggs = sample_ingredient(user=self.user, name='Eggs')
+        milk = sample_ingredient(user=self.user, name='Milk')
+        recipe = sample_recipe(user=self.user)
+        recipe.ingredients.add(eggs, milk)
+
+        res = self.client.get(COOKABLE_URL, {'pantry': eggs.id})
+        self.assertEqual(len(res.data['results']), 0)
+
+        with capture_on_commit_callbacks(execute=True):
+            milk.delete()
+        res = self.client.get(COOKABLE_URL, {'pantry': eggs.id})
+        self.assertEqual(len(res.data['results']), 1)
+
+        with capture_on_commit_callbacks(execute=True):
+            recipe.ingredients.add(sample_ingredient(user=self.user))
+        res = self.client.get(COOKABLE_URL, {'pantry': eggs.id})
+        self.assertEqual(len(res.data['results']), 0)
+
+    @patch.object(CookablePagination, 'page_size', 2)
+    def test_cookable_recipes_paginated(self):
+        """Testa a paginacao das receitas pelo que falta"""
+        eggs = sample_ingredient(user=self.user, name='Eggs')
+        expected = []
+        for i in range(5):
+            recipe = sample_recipe(user=self.user)
+            recipe.ingredients.add(eggs, *[
+                sample_ingredient(user=self.user, name=f'{i}-{j}')
+                for j in range(i % 3)
+            ])
+            expected.append((i % 3, -recipe.id))
+
+        res = self.client.get(COOKABLE_URL, {'pantry': eggs.id,
+                                             'missing': 2})
+        found = res.data['results']
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            found += res.data['results']
+
+        self.assertEqual(
+            [(len(item['missing']), -item['id']) for item in found],
+            sorted(expected)
+        )
+
+    def test_cookable_recipes_invalid(self):
+        """Testa que a despensa precisa ser uma lista de ids"""
+        res = self.client.get(COOKABLE_URL, {'pantry': 'eggs'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_similar_recipes(self):
+        """Testa as receitas parecidas pelas tags e ingredientes"""
+        tags = [sample_tag(user=self.user, name=f'Tag {i}')
+                for i in range(6)]
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(*tags[:4])
+        close = sample_recipe(user=self.user, title='Close')
+        close.tags.add(*tags[:4], tags[4])
+        far = sample_recipe(user=self.user, title='Far')
+        far.tags.add(tags[5])
+
+        res = self.client.get(similar_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        ids = [item['id'] for item in res.data]
+        self.assertEqual(ids[0], close.id)
+        self.assertNotIn(recipe.id, ids)
+        self.assertNotIn(far.id, ids)
+        self.assertGreater(res.data[0]['similarity'], 0.5)
+
+        with capture_on_commit_callbacks(execute=True):
+            far.tags.set(tags[:4])
+        res = self.client.get(similar_url(recipe.id))
+        self.assertEqual(res.data[0]['id'], far.id)
+        self.assertEqual(res.data[0]['similarity'], 1.0)
+
+    @patch.object(RecipeViewSet, 'similar_max_candidates', 2)
+    def test_similar_recipes_max_candidates(self):
+        """Testa que, com mais candidatas que o limite, ficam as que mais
+        dividem chaves LSH"""
+        tags = [sample_tag(user=self.user, name=f'Tag {i}')
+                for i in range(12)]
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(*tags[:4])
+        for i in range(4):
+            other = sample_recipe(user=self.user, title=f'Other {i}')
+            other.tags.add(*tags[:2], *tags[4 + 2 * i:6 + 2 * i])
+        same = sample_recipe(user=self.user, title='Same')
+        same.tags.add(*tags[:4])
+
+        res = self.client.get(similar_url(recipe.id))
+
+        self.assertEqual(res.data[0]['id'], same.id)
+        self.assertEqual(res.data[0]['similarity'], 1.0)
+
+    def test_similar_recipes_of_other_user(self):
+        """Testa que nao eh possivel ver parecidas de outro usuario"""
+        user2 = get_user_model().objects.create_user(
+            'teste2@gmail.com', 'testpass2'
+        )
+        recipe = sample_recipe(user=user2)
+
+        res = self.client.get(similar_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_filter_recipes_by_price_and_time(self):
+        """Testa os filtros por faixa de preco e tempo de preparo"""
+        cheap = sample_recipe(user=self.user, price=Decimal('2.00'),
+                              time_minutes=10)
+        sample_recipe(user=self.user, price=Decimal('8.00'),
+                      time_minutes=10)
+        sample_recipe(user=self.user, price=Decimal('4.00'),
+                      time_minutes=90)
+
+        res = self.client.get(RECIPE_URL, {'price_max': '5', 'time_max': 30})
+        self.assertEqual([item['id'] for item in res.data['results']],
+                         [cheap.id])
+
+        res = self.client.get(RECIPE_URL, {'price_min': '6'})
+        self.assertEqual(len(res.data['results']), 1)
+
+        res = self.client.get(RECIPE_URL, {'price_min': 'cheap'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @patch.object(RecipePagination, 'page_size', 2)
+    def test_order_recipes_by_price(self):
+        """Testa a ordenacao paginada pelo preco"""
+        for price in ('3.00', '1.00', '3.00', '2.00', '5.00'):
+            sample_recipe(user=self.user, price=Decimal(price))
+
+        for ordering in ('price', '-price'):
+            res = self.client.get(RECIPE_URL, {'ordering': ordering})
+            found = res.data['results']
+            while res.data['next']:
+                res = self.client.get(res.data['next'])
+                found += res.data['results']
+
+            keys = [(Decimal(item['price']), item['id']) for item in found]
+            self.assertEqual(
+                keys, sorted(keys, reverse=ordering.startswith('-'))
+            )
+
+    @patch.object(RecipePagination, 'page_size', 2)
+    def test_order_recipes_by_tied_price(self):
+        """Testa que paginar muitos precos iguais percorre a chave
+        (price, id), sem OFFSET, sem repetir nem pular receitas"""
+        for price in ['9.99'] * 9 + ['4.50'] * 3 + ['12.00']:
+            sample_recipe(user=self.user, price=Decimal(price))
+
+        for ordering in ('price', '-price'):
+            res = self.client.get(RECIPE_URL, {'ordering': ordering})
+            pages = [res.data['results']]
+            with CaptureQueriesContext(connection) as queries:
+                while res.data['next']:
+                    res = self.client.get(res.data['next'])
+                    pages.append(res.data['results'])
+
+            found = [item for page in pages for item in page]
+            keys = [(Decimal(item['price']), item['id']) for item in found]
+            self.assertEqual(len(set(keys)), len(keys))
+            self.assertEqual(len(keys), Recipe.objects.count())
+            self.assertEqual(
+                keys, sorted(keys, reverse=ordering.startswith('-'))
+            )
+            self.assertFalse([query for query in queries.captured_queries
+                              if 'OFFSET' in query['sql']])
+
+            # E de volta pelos links anteriores
+            for page in reversed(pages[:-1]):
+                res = self.client.get(res.data['previous'])
+                self.assertEqual(res.data['results'], page)
+            self.assertIsNone(res.data['previous'])
+
+    def test_order_recipes_invalid(self):
+        """Testa que so campos indexados podem ser usados na ordenacao"""
+        for ordering in ('title', '--price'):
+            res = self.client.get(RECIPE_URL, {'ordering': ordering})
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
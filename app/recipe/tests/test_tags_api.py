@@ -1,4 +1,8 @@
+from unittest.mock import patch
+
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.test import TestCase
 
@@ -6,9 +10,13 @@ from rest_framework import status
 from rest_framework.test import APIClient
 
 from core.models import Tag, Recipe
+from core.tests.utils import capture_on_commit_callbacks
+from recipe.pagination import BaseRecipeAttrPagination
 from recipe.serializers import TagSerializer
 
 TAGS_URL = reverse('recipe:tag-list')
+TAGS_UPSERT_URL = reverse('recipe:tag-bulk-upsert')
+TAGS_AUTOCOMPLETE_URL = reverse('recipe:tag-autocomplete')
 
 
 class PublicTagsAPITests(TestCase):
@@ -45,7 +53,7 @@ class PrivateTagsAPITEsts(TestCase):
         serializer = TagSerializer(tags, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_tags_limited_to_user(self):
         """Testa que apenas eh listado as tags do usuario"""
@@ -58,8 +66,8 @@ class PrivateTagsAPITEsts(TestCase):
 
         res = self.client.get(TAGS_URL)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], tag.name)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], tag.name)
 
     def test_create_tag_successful(self):
         """Teste se criamos nova tag"""
@@ -72,6 +80,92 @@ class PrivateTagsAPITEsts(TestCase):
         ).exists()
         self.assertTrue(exists)
 
+    def test_tags_cache_invalidated_on_create(self):
+        """Testa que criar uma tag invalida a lista em cache"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(TAGS_URL)
+
+        with capture_on_commit_callbacks(execute=True):
+            self.client.post(TAGS_URL, {'name': 'Dessert'})
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(len(res.data['results']), 2)
+
+    def test_create_tag_duplicate(self):
+        """Testa que nao eh possivel criar a mesma tag duas vezes"""
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.post(TAGS_URL, {'name': ' Vegan '})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+
+    def test_bulk_upsert_tags(self):
+        """Testa que o upsert em lote cria so as tags que faltam"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+
+        with self.assertNumQueries(1):
+            res = Tag.objects.upsert_names(
+                self.user, ['Dessert', 'Vegan', ' Dessert']
+            )
+        self.assertEqual(res[1], (tag.id, 'Vegan', False))
+        self.assertTrue(res[0][2])
+
+        res2 = self.client.post(
+            TAGS_UPSERT_URL, {'names': ['Vegan', 'Dessert']}, format='json'
+        )
+        self.assertEqual(res2.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(item['id'], item['created']) for item in res2.data],
+            [(tag.id, False), (res[0][0], False)]
+        )
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+
+    def test_bulk_upsert_tags_invalid(self):
+        """Testa que o upsert em lote exige ao menos um nome"""
+        res = self.client.post(TAGS_UPSERT_URL, {'names': []}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_autocomplete_tags(self):
+        """Testa o autocomplete por prefixo, sem diferenciar maiusculas"""
+        user2 = get_user_model().objects.create_user(
+            'other@gmail.com', 'testpass'
+        )
+        Tag.objects.create(user=user2, name='Breakfast')
+        for name in ('brunch', 'Breakfast', 'Dinner', 'Bread 100%'):
+            Tag.objects.create(user=self.user, name=name)
+
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL, {'prefix': 'BR'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([tag['name'] for tag in res.data],
+                         ['Bread 100%', 'Breakfast', 'brunch'])
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL,
+                              {'prefix': 'br', 'limit': 1})
+        self.assertEqual([tag['name'] for tag in res.data], ['Bread 100%'])
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL, {'prefix': 'bread 1%'})
+        self.assertEqual(len(res.data), 0)
+
+    def test_autocomplete_tags_invalid(self):
+        """Testa que o autocomplete exige prefixo e limita o tamanho"""
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL,
+                              {'prefix': 'a', 'limit': 1000})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_autocomplete_tags_cache_invalidated(self):
+        """Testa que o autocomplete em cache ve as tags novas"""
+        self.client.get(TAGS_AUTOCOMPLETE_URL, {'prefix': 'v'})
+
+        with capture_on_commit_callbacks(execute=True):
+            Tag.objects.create(user=self.user, name='Vegan')
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL, {'prefix': 'v'})
+
+        self.assertEqual([tag['name'] for tag in res.data], ['Vegan'])
+
     def test_create_tag_invalid(self):
         """Testando criar uma nova tag com dados invalidos"""
         payload = {'name': ''}
@@ -97,8 +191,8 @@ class PrivateTagsAPITEsts(TestCase):
         serializer1 = TagSerializer(tag1)
         serializer2 = TagSerializer(tag2)
 
-        self.assertIn(serializer1.data, res.data)
-        self.assertNotIn(serializer2.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertNotIn(serializer2.data, res.data['results'])
 
     def test_retrieve_tags_assigned_unique(self):
         """Retorna tags unicas"""
@@ -120,4 +214,28 @@ class PrivateTagsAPITEsts(TestCase):
         recipe2.tags.add(tag)
 
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_assigned_only_uses_exists(self):
+        """Testa que o filtro assigned_only usa EXISTS sem DISTINCT"""
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(TAGS_URL, {'assigned_only': 1})
+
+        sql = ctx.captured_queries[-1]['sql']
+        self.assertIn('EXISTS', sql)
+        self.assertNotIn('DISTINCT', sql)
+
+    @patch.object(BaseRecipeAttrPagination, 'page_size', 2)
+    def test_retrieve_tags_paginated(self):
+        """Testa que as tags sao paginadas por cursor"""
+        for name in ('A', 'B', 'C', 'D', 'E'):
+            Tag.objects.create(user=self.user, name=name)
+
+        res = self.client.get(TAGS_URL)
+        names = [tag['name'] for tag in res.data['results']]
+        self.assertIsNone(res.data['previous'])
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            names += [tag['name'] for tag in res.data['results']]
+
+        self.assertEqual(names, ['E', 'D', 'C', 'B', 'A'])
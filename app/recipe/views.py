@@ -1,19 +1,40 @@
+import hashlib
+import heapq
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import Count, Exists, F, FloatField, OuterRef, \
+    Prefetch
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, Lower
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import quote_etag
+
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
 
-from core.models import Tag, Ingredient, Recipe
+from core import images, similarity
+from core.authentication import CachedTokenAuthentication
+from core.renderers import IgnoreClientContentNegotiation
+from core.uploads import ImageUploadHandler
+from core.models import Tag, Ingredient, Recipe, SEARCH_CONFIG
 from recipe import serializers
+from recipe.mixins import CachedListMixin, make_etag
+from recipe.pagination import BaseRecipeAttrPagination, \
+    CookablePagination, RecipePagination
 
 
-class BaseRecipeAttr(viewsets.GenericViewSet,
+class BaseRecipeAttr(CachedListMixin,
+                     viewsets.GenericViewSet,
                      mixins.ListModelMixin,
                      mixins.CreateModelMixin):
     """Classe Base"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = BaseRecipeAttrPagination
 
     def get_queryset(self):
         """Retornando apenas objetos do usuario"""
@@ -22,15 +43,56 @@ class BaseRecipeAttr(viewsets.GenericViewSet,
         )
         queryset = self.queryset
         if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
+            queryset = queryset.annotate(
+                assigned=Exists(self._assigned_links())
+            ).filter(assigned=True)
+
+        return queryset.filter(user=self.request.user).order_by('-name')
 
-        return queryset.filter(user=self.request.user) \
-            .order_by('-name').distinct()
+    def _assigned_links(self):
+        """Vinculos com receitas do objeto da query externa, usados num
+        EXISTS que para no primeiro vinculo encontrado"""
+        relation = self.queryset.model._meta.get_field('recipe')
+        return relation.through.objects.filter(**{
+            relation.field.m2m_reverse_field_name(): OuterRef('pk')
+        })
 
     def perform_create(self, serializer):
         """Criando novo objeto"""
         serializer.save(user=self.request.user)
 
+    @action(methods=['POST'], detail=False, url_path='bulk-upsert')
+    def bulk_upsert(self, request):
+        """Retorna os ids de varios nomes, criando os que nao existem"""
+        serializer = serializers.NameListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        rows = self.queryset.model.objects.upsert_names(
+            request.user, serializer.validated_data['names']
+        )
+        return Response(
+            [{'id': pk, 'name': name, 'created': created}
+             for pk, name, created in rows],
+            status=status.HTTP_200_OK
+        )
+
+    @action(methods=['GET'], detail=False, url_path='autocomplete')
+    def autocomplete(self, request):
+        """Ate `limit` objetos cujo nome comeca com `prefix`, ignorando
+        maiusculas, usando o indice (user_id, lower(name))"""
+        params = serializers.AutocompleteSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        prefix = params.validated_data['prefix'].lower()
+        limit = params.validated_data['limit']
+
+        def get_data():
+            queryset = self.get_queryset() \
+                .annotate(lower_name=Lower('name')) \
+                .filter(lower_name__startswith=prefix) \
+                .order_by('lower_name', 'id')
+            return list(queryset.values('id', 'name')[:limit])
+
+        return self.cached_response(request, get_data)
+
 
 class TagViewSet(BaseRecipeAttr):
     """Gerenciando tags do banco"""
@@ -44,31 +106,126 @@ class IngredientsViewSet(BaseRecipeAttr):
     serializer_class = serializers.IngredientSerializer
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(CachedListMixin, viewsets.ModelViewSet):
     """Gerenciando receitas do banco"""
     serializer_class = serializers.RecipeSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = RecipePagination
+
+    match_modes = ('any', 'all')
+    export_chunk_size = 2000
+    similar_max_candidates = 5000
 
     @staticmethod
     def _params_to_ints(qs):
         """Converte uma lista de string ID to int ID list"""
         return [int(str_id) for str_id in qs.split(',')]
 
+    @staticmethod
+    def _filter_by_relation(queryset, relation, ids, match):
+        """Filtra as receitas vinculadas a `ids` pela tabela m2m de
+        `relation`, sem joins na query principal (logo sem duplicatas)"""
+        field = Recipe._meta.get_field(relation)
+        target = f'{field.m2m_reverse_field_name()}_id'
+        links = field.remote_field.through.objects.filter(
+            **{f'{target}__in': ids}
+        )
+        if match == 'all':
+            # Receitas com um vinculo para cada id pedido
+            matched = links.values('recipe_id') \
+                .annotate(matched=Count(target)) \
+                .filter(matched=len(set(ids)))
+            return queryset.filter(id__in=matched.values('recipe_id'))
+
+        return queryset.annotate(**{
+            f'has_{relation}': Exists(links.filter(recipe_id=OuterRef('pk')))
+        }).filter(**{f'has_{relation}': True})
+
     def get_queryset(self):
         """Limitar as receitas para o usuario
         autenticado"""
         tags = self.request.query_params.get('tags')
         ingredients = self.request.query_params.get('ingredients')
+        match = self.request.query_params.get('match', 'any')
+        if match not in self.match_modes:
+            raise ValidationError(
+                {'match': f'Use one of: {", ".join(self.match_modes)}'}
+            )
         queryset = self.queryset
         if tags:
             tags_id = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tags_id)
+            queryset = self._filter_by_relation(
+                queryset, 'tags', tags_id, match
+            )
         if ingredients:
             ingredients_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredients_ids)
-        return queryset.filter(user=self.request.user)
+            queryset = self._filter_by_relation(
+                queryset, 'ingredients', ingredients_ids, match
+            )
+        queryset = queryset.filter(user=self.request.user)
+        ranges = serializers.RecipeRangeSerializer(
+            data=self.request.query_params
+        )
+        ranges.is_valid(raise_exception=True)
+        lookups = {'price_min': 'price__gte', 'price_max': 'price__lte',
+                   'time_max': 'time_minutes__lte'}
+        queryset = queryset.filter(**{
+            lookups[name]: value
+            for name, value in ranges.validated_data.items()
+        })
+        fields = serializers.RecipeValuesSerializer.value_fields
+        search = self.request.query_params.get('search', '').strip()
+        if search:
+            # A paginacao ordena pelo rank quando ele existe. O ts_rank e
+            # real (float4) e o cursor guarda str(rank), comparado depois
+            # como double: em double precision o texto volta exato.
+            query = SearchQuery(search, config=SEARCH_CONFIG)
+            queryset = queryset.filter(search_vector=query).annotate(rank=Cast(
+                SearchRank(F('search_vector'), query), FloatField()
+            ))
+            fields += ('rank',)
+        if self.action in ('list', 'export') \
+                and self.request.method == 'GET':
+            return queryset.values(*fields)
+        # Busca os ids de tags e ingredientes de todas as receitas em
+        # duas queries fixas, em vez de duas queries por receita
+        return queryset.prefetch_related(
+            Prefetch('tags', Tag.objects.order_by('id')),
+            Prefetch('ingredients', Ingredient.objects.order_by('id')),
+        )
+
+    def get_serializer(self, *args, **kwargs):
+        """Listas de receitas usam o caminho rapido de leitura"""
+        if self.action == 'list' and kwargs.pop('many', False):
+            kwargs['context'] = self.get_serializer_context()
+            return serializers.RecipeValuesSerializer(*args, **kwargs)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_last_modified(self, pk):
+        """Busca apenas o updated_at da receita, ou None se nao existir"""
+        try:
+            return Recipe.objects.filter(user=self.request.user, pk=pk) \
+                .values_list('updated_at', flat=True).first()
+        except ValueError:
+            return None
+
+    def retrieve(self, request, *args, **kwargs):
+        """Detalhe da receita com suporte a GET condicional"""
+        updated_at = self.get_last_modified(kwargs['pk'])
+        if updated_at is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        etag = make_etag(request, kwargs['pk'], updated_at.isoformat())
+        # O If-Modified-Since tem precisao de segundos
+        last_modified = int(updated_at.timestamp())
+        not_modified = self.get_not_modified(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        response = super().retrieve(request, *args, **kwargs)
+        return self.set_conditional_headers(response, etag, last_modified)
 
     def get_serializer_class(self):
         """Retorna o serializer correto"""
@@ -82,17 +239,35 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Cria uma nova receita"""
         serializer.save(user=self.request.user)
 
+    def create(self, request, *args, **kwargs):
+        """Cria uma receita, ou varias se o corpo for uma lista"""
+        if not isinstance(request.data, list):
+            return super().create(request, *args, **kwargs)
+
+        serializer = serializers.RecipeBulkSerializer(
+            data=request.data, many=True,
+            context=self.get_serializer_context()
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save(user=request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
         """Faz o upload de uma imagem na receita"""
         recipe = self.get_object()
+        # Antes de acessar request.data: o corpo vai direto para um arquivo
+        # temporario, com os limites de tamanho checados durante a leitura
+        request.upload_handlers = [ImageUploadHandler(request)]
         serializer = self.get_serializer(
             recipe,
             data=request.data
         )
 
         if serializer.is_valid():
-            serializer.save()
+            recipe = serializer.save()
+            if recipe.image:
+                images.enqueue_variants(recipe)
             return Response(
                 serializer.data,
                 status=status.HTTP_200_OK
@@ -102,3 +277,131 @@ class RecipeViewSet(viewsets.ModelViewSet):
             serializer.errors,
             status=status.HTTP_400_BAD_REQUEST
         )
+
+    @action(methods=['GET'], detail=True, url_path='image',
+            content_negotiation_class=IgnoreClientContentNegotiation)
+    def resized_image(self, request, pk=None):
+        """Imagem da receita em WebP com a largura pedida (?width=),
+        gerada na primeira vez e depois servida do cache em disco"""
+        params = serializers.ImageWidthSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        width = params.validated_data['width']
+        name = get_object_or_404(
+            Recipe.objects.filter(user=request.user).values('image'), pk=pk
+        )['image']
+        if not name:
+            raise NotFound('This recipe has no image.')
+
+        etag = quote_etag(hashlib.sha1(
+            images.resized_key(name, width).encode()
+        ).hexdigest())
+        not_modified = self.get_not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+
+        image = images.open_resized(name, width)
+        if isinstance(image, bytes):
+            response = HttpResponse(image, content_type='image/webp')
+        else:
+            response = FileResponse(image, content_type='image/webp')
+        return self.set_conditional_headers(response, etag)
+
+    @action(methods=['GET'], detail=False, url_path='export')
+    def export(self, request):
+        """Exporta todas as receitas do usuario em NDJSON, em streaming
+
+        Com `Accept: application/json` o corpo e um unico array JSON,
+        tambem gerado em pedacos."""
+        queryset = self.get_queryset().order_by('id')
+        serializer = serializers.RecipeExportSerializer(
+            queryset, context=self.get_serializer_context()
+        )
+        if 'application/json' in request.META.get('HTTP_ACCEPT', ''):
+            content = serializer.iter_json(self.export_chunk_size)
+            content_type, filename = 'application/json', 'recipes.json'
+        else:
+            content = serializer.iter_ndjson(self.export_chunk_size)
+            content_type, filename = 'application/x-ndjson', 'recipes.ndjson'
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = \
+            f'attachment; filename="{filename}"'
+        return response
+
+    def _serialize_ids(self, ids):
+        """Serializa as receitas de `ids`, na mesma ordem, pelo caminho
+        rapido de leitura"""
+        rows = {
+            row['id']: row for row in Recipe.objects.filter(id__in=ids)
+            .values(*serializers.RecipeValuesSerializer.value_fields)
+        }
+        return serializers.RecipeValuesSerializer(
+            [rows[pk] for pk in ids], context=self.get_serializer_context()
+        ).data
+
+    @action(methods=['GET'], detail=False, url_path='cookable')
+    def cookable(self, request):
+        """Receitas que podem ser feitas com os ingredientes de `pantry`,
+        faltando no maximo `missing` deles
+
+        So os vinculos dos ingredientes da despensa sao lidos (indice
+        (ingredient_id, recipe_id)); o que falta vem do ingredient_count.
+        Receitas sem nenhum ingrediente da despensa nao sao sugeridas."""
+        params = serializers.CookableSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        pantry = params.validated_data['pantry']
+        links = Recipe.ingredients.through.objects \
+            .filter(ingredient_id__in=pantry, recipe__user=request.user) \
+            .values('recipe_id') \
+            .annotate(missing=F('recipe__ingredient_count') - Count('*')) \
+            .filter(missing__lte=params.validated_data['missing'])
+
+        def get_data():
+            paginator = CookablePagination()
+            page = paginator.paginate_queryset(links, request, view=self)
+            data = self._serialize_ids([link['recipe_id'] for link in page])
+            for item in data:
+                item['missing'] = [pk for pk in item['ingredients']
+                                   if pk not in pantry]
+            return paginator.get_paginated_response(data).data
+
+        return self.cached_response(request, get_data)
+
+    @action(methods=['GET'], detail=True, url_path='similar')
+    def similar(self, request, pk=None):
+        """Receitas mais parecidas pelas tags e ingredientes
+
+        As candidatas sao as receitas com alguma chave LSH em comum
+        (indice GIN em lsh_bands), ordenadas pela similaridade de Jaccard
+        estimada pelas assinaturas MinHash. Acima de
+        similar_max_candidates ficam as que mais dividem chaves, que sao
+        as mais parecidas, e o resultado nao depende do plano."""
+        params = serializers.LimitSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        limit = params.validated_data['limit']
+
+        def get_data():
+            recipes = Recipe.objects.filter(user=request.user)
+            recipe = get_object_or_404(
+                recipes.values('minhash', 'lsh_bands'), pk=pk
+            )
+            shared_bands = RawSQL(
+                'cardinality(array(SELECT unnest('
+                f'{Recipe._meta.db_table}.lsh_bands) '
+                'INTERSECT SELECT unnest(%s::bigint[])))',
+                (recipe['lsh_bands'],)
+            )
+            candidates = recipes \
+                .filter(lsh_bands__overlap=recipe['lsh_bands']) \
+                .exclude(pk=pk) \
+                .order_by(shared_bands.desc(), '-id') \
+                .values_list('id', 'minhash')[:self.similar_max_candidates]
+            scores = heapq.nlargest(limit, (
+                (similarity.similarity(recipe['minhash'], sig), other)
+                for other, sig in candidates
+            ))
+            data = self._serialize_ids([other for _, other in scores])
+            for item, (score, _) in zip(data, scores):
+                item['similarity'] = round(score, 3)
+            return data
+
+        return self.cached_response(request, get_data)
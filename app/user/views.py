@@ -1,8 +1,10 @@
 from user.serializers import UserSerializer, AuthTokenSerializer
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
 
+from core.authentication import CachedTokenAuthentication
+
 
 class CreateUSerView(generics.CreateAPIView):
     """Create a new user in the system"""
@@ -18,7 +20,7 @@ class CreateTokenView(ObtainAuthToken):
 class ManageUSerView(generics.RetrieveUpdateAPIView):
     """Gerenciando o usuario autenticado"""
     serializer_class = UserSerializer
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
     def get_object(self):